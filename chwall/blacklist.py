@@ -0,0 +1,223 @@
+import os
+import yaml
+import hashlib
+import threading
+from PIL import Image
+
+# chwall imports
+from chwall.utils import BASE_CACHE_PATH, file_checksum, get_logger
+
+import gettext
+# Uncomment the following line during development.
+# Please, be cautious to NOT commit the following line uncommented.
+# gettext.bindtextdomain("chwall", "./locale")
+gettext.textdomain("chwall")
+_ = gettext.gettext
+
+logger = get_logger(__name__)
+
+
+BLACKLIST_FILE = "{}/blacklist.idx".format(BASE_CACHE_PATH)
+FINGERPRINTS_FILE = "{}/blacklist_fingerprints.idx".format(BASE_CACHE_PATH)
+# Former YAML blacklist, imported on first use
+LEGACY_BLACKLIST = "{}/blacklist.yml".format(BASE_CACHE_PATH)
+DIGEST_SIZE = 16
+# A fingerprint is made of the SHA-256 sum of the picture followed by its
+# 8 bytes perceptual hash.
+SHA_SIZE = 32
+DHASH_SIZE = 8
+FINGERPRINT_SIZE = SHA_SIZE + DHASH_SIZE
+# Maximum number of differing bits between two perceptual hashes of the
+# same picture (resized, recompressed...)
+DHASH_DISTANCE = 4
+# Perceptual hashes of low contrast pictures (night sky, plain colors...)
+# have almost all their bits set or unset, and look alike. Those with fewer
+# than that many bits set or unset are ignored.
+DHASH_MIN_BITS = 8
+# Query parameters only used by some image hosts to resize or recompress a
+# picture. Elsewhere, they may identify the picture itself.
+RESIZE_PARAMS = {
+    "images.unsplash.com": {"auto", "crop", "cs", "dpr", "fit", "fm", "h",
+                            "q", "w"},
+    "images.pexels.com": {"auto", "crop", "cs", "dpr", "fit", "h", "w"}
+}
+_RESIZE_PREFIXES = tuple("{}://{}/".format(scheme, host)
+                         for host in RESIZE_PARAMS
+                         for scheme in ["http", "https"])
+
+
+def canonical_url(url):
+    """Return url without its resizing query parameters, if any."""
+    # This is called for each fetched picture, thus it avoids a complete
+    # url parsing.
+    if not url.startswith(_RESIZE_PREFIXES):
+        return url
+    base, _sep, query = url.partition("?")
+    if query == "":
+        return url
+    resize_params = RESIZE_PARAMS[base.split("/", 3)[2]]
+    query = "&".join(p for p in query.split("&")
+                     if p.partition("=")[0] not in resize_params)
+    if query == "":
+        return base
+    return "{}?{}".format(base, query)
+
+
+def url_digest(url):
+    return hashlib.blake2b(url.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def picture_dhash(path):
+    """Return the 64 bits difference hash of a picture file, or None.
+
+    Each bit tells if a pixel of a tiny grayscale version of the picture is
+    brighter than its right neighbour. It does not change much when the
+    picture is resized or compressed again.
+    """
+    try:
+        with Image.open(path) as im:
+            # Let JPEG decoder directly produce a smaller picture, instead
+            # of decoding a huge one first.
+            im.draft("L", (72, 64))
+            small = im.convert("L").resize((9, 8))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = small.tobytes()
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            dhash = (dhash << 1) | (left > pixels[row * 9 + col + 1])
+    return dhash
+
+
+def is_distinctive(dhash):
+    """Tell if a perceptual hash is meaningful enough to be compared."""
+    if dhash is None:
+        return False
+    bits = bin(dhash).count("1")
+    return DHASH_MIN_BITS <= bits <= 64 - DHASH_MIN_BITS
+
+
+def file_fingerprint(path, checksum=None):
+    """Return the (SHA-256 digest, perceptual hash) tuple of a picture file.
+
+    checksum is the hexadecimal SHA-256 sum of the file, if already known.
+    """
+    if checksum is None:
+        checksum = file_checksum(path)
+    return bytes.fromhex(checksum), picture_dhash(path)
+
+
+def _read_records(path, offset, size):
+    # Return the complete records of the given size found after offset, and
+    # the new offset. A record may be partially written right now.
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    usable = len(data) - len(data) % size
+    return ([data[pos:pos + size] for pos in range(0, usable, size)],
+            offset + usable)
+
+
+def _append_records(path, records):
+    if not records:
+        return
+    # Writes of a few bytes in append mode are atomic, thus concurrent
+    # processes cannot mix their records.
+    with open(path, "ab") as f:
+        f.write(b"".join(records))
+
+
+class Blacklist:
+    """Set of the pictures, which must never be shown again.
+
+    Only a fixed size digest of each picture url is stored, in a file which
+    is only appended to. It is loaded once in memory, thus checking if a
+    picture is blacklisted does not depend on the blacklist size. Digests
+    added since by other processes are read again by ``refresh``.
+
+    The fingerprint of blacklisted pictures content is stored the same way,
+    to recognize them when they come back under another url.
+    """
+
+    def __init__(self):
+        self._digests = set()
+        self._shas = set()
+        self._dhashes = []
+        self._offsets = [0, 0]
+        self._lock = threading.Lock()
+        if os.path.exists(LEGACY_BLACKLIST):
+            self.import_yaml_blacklist(LEGACY_BLACKLIST)
+        self.refresh()
+
+    def __contains__(self, url):
+        return url_digest(canonical_url(url)) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+    def refresh(self):
+        with self._lock:
+            digests, self._offsets[0] = _read_records(
+                BLACKLIST_FILE, self._offsets[0], DIGEST_SIZE)
+            self._digests.update(digests)
+            fingerprints, self._offsets[1] = _read_records(
+                FINGERPRINTS_FILE, self._offsets[1], FINGERPRINT_SIZE)
+            for record in fingerprints:
+                self._shas.add(record[:SHA_SIZE])
+                dhash = int.from_bytes(record[SHA_SIZE:], "big")
+                if is_distinctive(dhash):
+                    self._dhashes.append(dhash)
+
+    def add(self, urls):
+        digests = [url_digest(canonical_url(url)) for url in urls]
+        _append_records(BLACKLIST_FILE,
+                        [d for d in set(digests) if d not in self._digests])
+        self.refresh()
+
+    def add_fingerprint(self, fingerprint):
+        sha, dhash = fingerprint
+        if self.matches_checksum(sha):
+            return
+        record = sha + (dhash or 0).to_bytes(DHASH_SIZE, "big")
+        _append_records(FINGERPRINTS_FILE, [record])
+        self.refresh()
+
+    def matches_checksum(self, sha):
+        """Tell if a picture is an exact copy of a blacklisted one."""
+        return sha in self._shas
+
+    def resembles(self, dhash):
+        """Tell if a picture looks like a blacklisted one.
+
+        It may only be a false positive, thus such a picture should be
+        skipped, but not blacklisted.
+        """
+        if not is_distinctive(dhash):
+            return False
+        return any(bin(dhash ^ known).count("1") <= DHASH_DISTANCE
+                   for known in self._dhashes)
+
+    def import_yaml_blacklist(self, path):
+        try:
+            with open(path, "r") as f:
+                urls = yaml.safe_load(f) or []
+        except FileNotFoundError:
+            return
+        except yaml.YAMLError:
+            urls = []
+        try:
+            os.replace(path, path + ".bak")
+        except FileNotFoundError:
+            # Already imported by another process
+            return
+        self.add(urls)
+        logger.info(_("Previous blacklist has been imported"))
+
+
+def read_blacklist():
+    return Blacklist()
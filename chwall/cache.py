@@ -0,0 +1,279 @@
+import os
+import time
+import sqlite3
+from PIL import Image
+
+# chwall imports
+from chwall.utils import BASE_CACHE_PATH, BROKEN_PICTURE_SUMS, \
+                         file_checksum, get_logger
+
+import gettext
+# Uncomment the following line during development.
+# Please, be cautious to NOT commit the following line uncommented.
+# gettext.bindtextdomain("chwall", "./locale")
+gettext.textdomain("chwall")
+_ = gettext.gettext
+
+logger = get_logger(__name__)
+
+
+PICTURES_PATH = "{}/pictures".format(BASE_CACHE_PATH)
+CACHE_DB = "{}/cache.db".format(BASE_CACHE_PATH)
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    mtime REAL,
+    checksum TEXT,
+    width INTEGER,
+    height INTEGER,
+    last_shown REAL,
+    valid INTEGER NOT NULL DEFAULT 1
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_last_used ON files(last_used);
+CREATE INDEX IF NOT EXISTS files_valid ON files(valid);
+"""
+
+
+def picture_size(path):
+    """Return the (width, height) of a picture, or (None, None).
+
+    Only the picture header is read, not its whole content.
+    """
+    try:
+        with Image.open(path) as im:
+            return im.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
+
+
+class PictureCache:
+    """Index of the pictures downloaded in cache.
+
+    It knows the size of each cached picture and when it was last used
+    (downloaded or displayed). The cache can then be kept under a given
+    size by removing the least recently used pictures first, without
+    scanning the pictures folder each time.
+
+    The index is filled from the pictures folder only once, when it is
+    created. Then, pictures must be registered with ``add`` as soon as they
+    are written in cache, and ``touch`` must be called each time they are
+    displayed.
+    """
+
+    def __init__(self):
+        self.conn = sqlite3.connect(CACHE_DB, timeout=30,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._depth = 0
+        with self:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self._create_tables()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        if self._depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+    def _create_tables(self):
+        # executescript would commit the current transaction
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                self.conn.execute(statement)
+        self._import_pictures_folder()
+        self.conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    def _import_pictures_folder(self):
+        if not os.path.exists(PICTURES_PATH):
+            return
+        for pic in os.scandir(PICTURES_PATH):
+            # Partial downloads are not pictures yet
+            if not pic.is_file() or ".part" in pic.name:
+                continue
+            self.add(pic.path, last_used=pic.stat().st_mtime)
+
+    def add(self, path, checksum=None, last_used=None):
+        """Register a picture written in cache.
+
+        checksum is the hexadecimal SHA-256 sum of the picture, if already
+        known. Otherwise, the picture is read to compute it. Empty pictures
+        and known placeholders (like the reddit broken picture) are
+        registered as invalid.
+        """
+        st = os.stat(path)
+        if checksum is None:
+            checksum = file_checksum(path)
+        width, height = picture_size(path)
+        valid = st.st_size > 0 and checksum not in BROKEN_PICTURE_SUMS
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, last_used, mtime, "
+            "checksum, width, height, valid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, st.st_size, last_used or time.time(), st.st_mtime,
+             checksum, width, height, valid))
+
+    def refresh(self, path, last_used=None):
+        """Register path again, or forget it if it does not exist anymore."""
+        try:
+            self.add(path, last_used=last_used)
+        except FileNotFoundError:
+            self.forget(path)
+
+    def get(self, path):
+        """Return the information known about a cached picture, or None."""
+        cursor = self.conn.execute(
+            "SELECT path, size, mtime, checksum, width, height, last_used, "
+            "last_shown, valid FROM files WHERE path = ?", (path,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        info = dict(zip([c[0] for c in cursor.description], row))
+        info["valid"] = bool(info["valid"])
+        return info
+
+    def touch(self, path):
+        """Remember that a cached picture has just been displayed."""
+        now = time.time()
+        self.conn.execute(
+            "UPDATE files SET last_used = ?, last_shown = ? WHERE path = ?",
+            (now, now, path))
+
+    def forget(self, path):
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def total_size(self):
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def broken_count(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE valid = 0").fetchone()[0]
+
+    def check(self):
+        """Update the index with pictures changed or removed behind it.
+
+        Only the size and modification time of each picture are checked.
+        Pictures are read again only when they changed.
+        """
+        with self:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime, last_used FROM files").fetchall()
+            for path, size, mtime, last_used in rows:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    self.forget(path)
+                    continue
+                if st.st_size != size or st.st_mtime != mtime:
+                    self.refresh(path, last_used)
+
+    def remove(self, broken_only=True):
+        """Remove the broken pictures from cache, or all of them.
+
+        Return the number of removed pictures.
+        """
+        query = "SELECT path FROM files"
+        if broken_only:
+            query += " WHERE valid = 0"
+        removed = 0
+        with self:
+            for (path,) in self.conn.execute(query).fetchall():
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                self.forget(path)
+        return removed
+
+    def evict(self, budget, protected=()):
+        """Remove least recently used pictures until cache fits in budget.
+
+        budget is a number of bytes. Pictures which path is in protected
+        are never removed. Return the number of removed pictures.
+        """
+        removed = 0
+        with self:
+            total = self.total_size()
+            if total <= budget:
+                return 0
+            rows = self.conn.execute(
+                "SELECT path, size FROM files ORDER BY last_used").fetchall()
+            for path, size in rows:
+                if total <= budget:
+                    break
+                if path in protected:
+                    continue
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    # Already removed by someone else
+                    pass
+                self.forget(path)
+                total -= size
+        logger.info(gettext.ngettext(
+            "{number} picture has been removed from cache.",
+            "{number} pictures have been removed from cache.",
+            removed
+        ).format(number=removed))
+        return removed
+
+
+def compute_cache_size():
+    pic_cache = PictureCache()
+    try:
+        cache_total = pic_cache.total_size() / 1000
+    finally:
+        pic_cache.close()
+    if cache_total > 1000000:
+        return "{} Go".format(str(round(cache_total/1000000, 2)))
+    elif cache_total > 1000:
+        return "{} Mo".format(str(round(cache_total/1000, 2)))
+    return "{} ko".format(str(round(cache_total, 2)))
+
+
+def count_broken_pictures_in_cache():
+    pic_cache = PictureCache()
+    try:
+        return pic_cache.broken_count()
+    finally:
+        pic_cache.close()
+
+
+def cleanup_cache(clear_all=False):
+    """Remove broken pictures from cache, or all of them if clear_all.
+
+    Pictures are not read, the cache index tells which ones are broken.
+    Return the number of removed files.
+    """
+    pic_cache = PictureCache()
+    try:
+        pic_cache.check()
+        deleted = pic_cache.remove(broken_only=not clear_all)
+    finally:
+        pic_cache.close()
+    if clear_all and os.path.exists(PICTURES_PATH):
+        # Also remove leftovers of interrupted downloads
+        for leftover in os.scandir(PICTURES_PATH):
+            if leftover.is_file():
+                os.unlink(leftover.path)
+                deleted += 1
+    return deleted
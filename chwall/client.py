@@ -2,15 +2,19 @@
 
 import os
 import sys
-import yaml
+import json
+import itertools
 import subprocess
 from xdg.BaseDirectory import xdg_data_home
 
 # chwall imports
 from chwall import __version__
 from chwall.daemon import notify_daemon_if_any, daemon_info, daemonize
-from chwall.utils import BASE_CACHE_PATH, read_config, \
-                         reset_pending_list, ServiceFileManager
+from chwall.fetcher import fetchers_manifest
+from chwall.health import sources_health_labels
+from chwall.utils import BASE_CACHE_PATH, read_config, ServiceFileManager
+from chwall.roadmap import ROADMAP_DB, LEGACY_ROADMAP, Roadmap, \
+                           reset_pending_list
 from chwall.wallpaper import blacklist_wallpaper, pick_wallpaper, \
                              favorite_wallpaper
 from chwall.gui.app import generate_desktop_file
@@ -31,6 +35,7 @@ SUBCOMMAND_ALIASES = {
     "once": "next",
     "kill": "quit"
 }
+HISTORY_PAGE_SIZE = 20
 
 
 class ChwallClient:
@@ -189,7 +194,8 @@ By default, this command will start the main app if no argument is given.
         self._print_usage("status [ open ]", "current [ open ]",
                           "info [ open ]")
         print(_("""
-Display the current wallpaper information.
+Display the current wallpaper information and the health of each picture
+source.
 
 If the optional ‘open’ keyword is given, the original resource will be opened,
 using the best dedicated tool for it (web browser, picture viewer...).
@@ -202,11 +208,29 @@ using the best dedicated tool for it (web browser, picture viewer...).
         print("".join(infos))
         dinfo = daemon_info()
         print(dinfo["last-change-label"])
+        print("\n" + _("Sources:"))
+        sources = read_config()["general"]["sources"]
+        for name, label in sources_health_labels(sources):
+            print("  {name}: {label}".format(name=name, label=label))
         if len(opts) != 0 and opts[0] == "open" and len(infos) >= 2:
             url = infos[1].strip()
             if url != "":
                 subprocess.run(["gio", "open", url])
 
+    def help_sources(self):
+        self._print_usage("sources")
+        print(_("""
+List the available pictures sources. The enabled ones are marked with a star.
+"""))
+
+    def cmd_sources(self, *opts):
+        enabled = read_config()["general"]["sources"]
+        for name, fetcher in fetchers_manifest().items():
+            mark = "*" if name in enabled else " "
+            label = fetcher["preferences"].get("name", name.capitalize())
+            print("{mark} {name} ({label})".format(
+                mark=mark, name=name, label=label))
+
     def help_blacklist(self):
         self._print_usage("blacklist")
         print(_("""
@@ -278,39 +302,117 @@ the next time it will change.
         reset_pending_list()
 
     def _road_map(self):
-        road_map = "{}/roadmap".format(BASE_CACHE_PATH)
-        if not os.path.exists(road_map):
+        if not os.path.exists(ROADMAP_DB) and \
+           not os.path.exists(LEGACY_ROADMAP):
             print(_("No roadmap has been created yet"), file=sys.stderr)
             sys.exit(1)
-        data = {}
-        with open(road_map, "r") as f:
-            data = yaml.safe_load(f)
-        return data
+        return Roadmap(read_config()["general"]["source_weights"])
+
+    def _parse_listing_options(self, opts, subcmd):
+        options = {"limit": -1, "offset": 0, "source": None, "json": False,
+                   "args": []}
+        opts = list(opts)
+        while len(opts) != 0:
+            arg = opts.pop(0)
+            if arg == "--json":
+                options["json"] = True
+                continue
+            name, sep, value = arg.partition("=")
+            if name not in ["--limit", "--offset", "--source"]:
+                options["args"].append(arg)
+                continue
+            if sep == "":
+                value = opts.pop(0) if len(opts) != 0 else ""
+            name = name[2:]
+            if name == "source":
+                options[name] = value
+                continue
+            try:
+                options[name] = int(value)
+            except ValueError:
+                options[name] = -1
+            if options[name] < 0:
+                getattr(self, "help_{}".format(subcmd))()
+                sys.exit(1)
+        return options
+
+    def _print_listing(self, road_map, urls, as_json):
+        for url in urls:
+            if not as_json:
+                print(url)
+                continue
+            entry = road_map.get(url)
+            if entry is None:
+                data = {"image": url}
+            else:
+                data = entry.to_data()
+                data["source"] = entry.pool
+                data["local-picture-path"] = entry.path
+            print(json.dumps(data))
 
     def help_history(self):
-        self._print_usage("history")
+        self._print_usage("history [ page ] [ --limit N ] [ --offset N ] "
+                          "[ --source NAME ] [ --json ]")
         print(_("""
 Display the last displayed wallpapers. The most recent one is at the bottom.
 
-This command display only the upstream url of each wallpaper.
-"""))
+When a page number is given, only display the {size} wallpapers of this
+page. Page 1 contains the most recent ones. Otherwise, --limit gives the
+maximum number of displayed wallpapers and --offset the number of most recent
+ones to skip.
+
+--source only displays the wallpapers coming from the given source.
+
+This command display only the upstream url of each wallpaper, unless --json is
+given. In that case, all the known information about each wallpaper is
+displayed as a JSON object, one per line.
+""").format(size=HISTORY_PAGE_SIZE))
 
     def cmd_history(self, *opts):
-        data = self._road_map()
-        print("\n".join(data["history"]))
+        options = self._parse_listing_options(opts, "history")
+        offset, limit = options["offset"], options["limit"]
+        if len(options["args"]) != 0:
+            try:
+                page = int(options["args"][0])
+            except ValueError:
+                page = 0
+            if page < 1:
+                self.help_history()
+                sys.exit(1)
+            offset, limit = (page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE
+        road_map = self._road_map()
+        self._print_listing(
+            road_map,
+            road_map.iter_history(offset, limit, options["source"]),
+            options["json"])
+        road_map.close()
 
     def help_pending(self):
-        self._print_usage("pending")
+        self._print_usage("pending [ --limit N ] [ --offset N ] "
+                          "[ --source NAME ] [ --json ]")
         print(_("""
 Display the next wallpapers, which will be shown in the future. The next one is
 at the top of the list.
 
-This command display only the upstream url of each wallpaper.
+--offset gives the number of next wallpapers to skip and --limit the maximum
+number of displayed ones. --source only displays the wallpapers coming from
+the given source.
+
+This command display only the upstream url of each wallpaper, unless --json is
+given. In that case, all the known information about each wallpaper is
+displayed as a JSON object, one per line.
 """))
 
     def cmd_pending(self, *opts):
-        data = self._road_map()
-        print("\n".join(data["pictures"]))
+        options = self._parse_listing_options(opts, "pending")
+        limit = options["limit"]
+        stop = None if limit < 0 else options["offset"] + limit
+        road_map = self._road_map()
+        urls = road_map.iter_pending(options["source"])
+        self._print_listing(
+            road_map, itertools.islice(urls, options["offset"], stop),
+            options["json"])
+        road_map.close()
 
 
 if __name__ == "__main__":
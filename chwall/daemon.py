@@ -4,14 +4,16 @@ import os
 import sys
 import time
 import signal
+import threading
 import subprocess
 
 # chwall imports
 from chwall import __version__
-from chwall.utils import BASE_CACHE_PATH, read_config, cleanup_cache, \
-                         get_logger
+from chwall.utils import BASE_CACHE_PATH, read_config, get_logger
+from chwall.cache import cleanup_cache
 from chwall.wallpaper import pick_wallpaper, ChwallWallpaperSetError, \
-                             current_wallpaper_info
+                             current_wallpaper_info, prefetch_wallpapers, \
+                             sources_to_refill, start_roadmap_filler
 
 
 import gettext
@@ -176,8 +178,64 @@ def show_notification():
                     wallinfo["description"]])
 
 
+_refill_thread = None
+
+
+def refill_roadmap_if_needed(config):
+    """Start a background refill when few pictures remain pending.
+
+    That way, the pending list never gets empty and a wallpaper change never
+    has to wait for the whole list to be fetched again. A source without
+    any pending picture left is also refilled on its own, such that it
+    keeps its share of the displayed wallpapers, as long as it brings new
+    ones.
+    """
+    global _refill_thread
+    if _refill_thread is not None and not _refill_thread.done:
+        return
+    sources = sources_to_refill(config)
+    if len(sources) == 0:
+        return
+    logger.info(_("Fetching new pictures from {sources}…")
+                .format(sources=", ".join(sources)))
+    # A wallpaper change waiting for new pictures will use this same refill
+    _refill_thread = start_roadmap_filler(config, sources)
+
+
+_prefetch_thread = None
+
+
+def prefetch_wallpapers_in_background(config):
+    # Pictures being fetched by a running refill may be the next ones
+    refill_thread = _refill_thread
+    if refill_thread is not None:
+        refill_thread.join()
+    try:
+        prefetch_wallpapers(config)
+    except Exception as e:
+        logger.error("{}: {}".format(type(e).__name__, e))
+
+
+def prefetch_wallpapers_if_needed(config):
+    """Start downloading the next pending pictures in background.
+
+    That way, they are already in cache when it is time to display them.
+    """
+    global _prefetch_thread
+    if config["general"]["prefetch_count"] <= 0:
+        return
+    if _prefetch_thread is not None and _prefetch_thread.is_alive():
+        return
+    _prefetch_thread = threading.Thread(
+        target=prefetch_wallpapers_in_background, args=(config,),
+        daemon=True)
+    _prefetch_thread.start()
+
+
 def daemon_step():
     config = read_config()
+    refill_roadmap_if_needed(config)
+    prefetch_wallpapers_if_needed(config)
     wait_before_change(config["general"]["sleep"])
     # Config may have change during sleep
     config = read_config()
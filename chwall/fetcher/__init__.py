@@ -0,0 +1,168 @@
+import os
+import sys
+import ast
+import json
+import yaml
+import hashlib
+import sysconfig
+import threading
+from importlib import import_module
+from importlib.util import find_spec
+
+# chwall imports
+from chwall import __version__
+from chwall.utils import BASE_CACHE_PATH, get_logger
+
+logger = get_logger(__name__)
+
+
+FETCHERS_PATH = os.path.dirname(__file__)
+MANIFEST_FILE = "{}/fetchers.yml".format(BASE_CACHE_PATH)
+MEMO_PATH = "{}/memo".format(BASE_CACHE_PATH)
+
+
+def _fetcher_files():
+    files = []
+    for entry in os.scandir(FETCHERS_PATH):
+        if not entry.name.endswith(".py") or entry.name.startswith("_"):
+            continue
+        files.append(entry)
+    return sorted(files, key=lambda e: e.name)
+
+
+def fetcher_names():
+    """Return the names of all available fetchers, without importing them."""
+    return [entry.name[:-3] for entry in _fetcher_files()]
+
+
+def _manifest_signature(files):
+    # Any change in the fetchers package, or in the locale used to translate
+    # the preferences labels, invalidates the manifest.
+    sig = hashlib.sha256(__version__.encode())
+    for entry in files:
+        st = entry.stat()
+        sig.update("{}:{}:{}".format(
+            entry.name, st.st_mtime_ns, st.st_size).encode())
+    for var in ["LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG"]:
+        sig.update("{}={}".format(var, os.getenv(var, "")).encode())
+    return sig.hexdigest()
+
+
+def _is_stdlib_module(name):
+    if hasattr(sys, "stdlib_module_names"):
+        return name in sys.stdlib_module_names
+    # Python older than 3.10: look where the module would be imported from,
+    # without importing it.
+    if name in sys.builtin_module_names:
+        return True
+    try:
+        spec = find_spec(name)
+    except (ImportError, ValueError):
+        return False
+    if spec is None or spec.origin is None:
+        return False
+    if spec.origin in ["built-in", "frozen"]:
+        return True
+    stdlib_path = os.path.realpath(sysconfig.get_paths()["stdlib"])
+    origin = os.path.realpath(spec.origin)
+    return (origin.startswith(stdlib_path + os.sep)
+            and "site-packages" not in origin)
+
+
+def _fetcher_dependencies(path):
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), path)
+    deps = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if top != "chwall" and not _is_stdlib_module(top):
+                deps.add(top)
+    return sorted(deps)
+
+
+def _build_manifest(files):
+    fetchers = {}
+    for entry in files:
+        name = entry.name[:-3]
+        try:
+            fetcher = load_fetcher(name)
+        except Exception as e:
+            # A missing dependency must not hide the other fetchers
+            logger.error(
+                "{} in {}: {}".format(type(e).__name__, name, e)
+            )
+            continue
+        if not hasattr(fetcher, "preferences"):
+            continue
+        # Go through JSON to get rid of tuples, which cannot be safely
+        # stored in YAML.
+        fetchers[name] = {
+            "preferences": json.loads(json.dumps(fetcher.preferences())),
+            "dependencies": _fetcher_dependencies(entry.path),
+            "streaming": hasattr(fetcher, "iter_pictures")
+        }
+    return fetchers
+
+
+def fetchers_manifest():
+    """Return information about all available fetchers.
+
+    The returned dictionary is indexed by fetcher name. Each value contains
+    the fetcher ``preferences`` (as returned by its ``preferences()``
+    function), its third-party ``dependencies`` and whether it is
+    ``streaming`` pictures or not.
+
+    This information is cached, thus fetchers modules are only imported
+    once, when they change.
+    """
+    files = _fetcher_files()
+    signature = _manifest_signature(files)
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            manifest = yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError):
+        manifest = {}
+    if manifest.get("signature") == signature:
+        return manifest["fetchers"]
+    manifest = {"signature": signature, "fetchers": _build_manifest(files)}
+    tmp_file = "{}.{}.{}".format(MANIFEST_FILE, os.getpid(),
+                                 threading.get_ident())
+    with open(tmp_file, "w") as f:
+        yaml.dump(manifest, f, explicit_start=True, default_flow_style=False)
+    os.replace(tmp_file, MANIFEST_FILE)
+    return manifest["fetchers"]
+
+
+def load_fetcher(name):
+    """Import and return the fetcher module of the given name."""
+    return import_module("chwall.fetcher.{}".format(name))
+
+
+def read_memo(name):
+    """Return the data a fetcher saved for itself during a previous run.
+
+    Fetchers use it to remember results which are expensive to compute and
+    will not change, like the picture address behind a web page.
+    """
+    try:
+        with open("{}/{}.yml".format(MEMO_PATH, name), "r") as f:
+            return yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError):
+        return {}
+
+
+def write_memo(name, memo):
+    os.makedirs(MEMO_PATH, exist_ok=True)
+    memo_file = "{}/{}.yml".format(MEMO_PATH, name)
+    tmp_file = "{}.{}.{}".format(memo_file, os.getpid(),
+                                 threading.get_ident())
+    with open(tmp_file, "w") as f:
+        yaml.dump(memo, f, explicit_start=True, default_flow_style=False)
+    os.replace(tmp_file, memo_file)
@@ -1,5 +1,6 @@
 import re
-import requests
+
+from chwall.network import cached_get
 
 import gettext
 # Uncomment the following line during development.
@@ -8,6 +9,10 @@ import gettext
 gettext.textdomain("chwall")
 _ = gettext.gettext
 
+# Bing updates its picture of the day once a day, but at different hours
+# depending on the locale.
+CACHE_TTL = 3 * 3600
+
 
 def fetch_pictures(config):
     bing_conf = config.get("bing", {}).get("locales", [])
@@ -20,7 +25,7 @@ def fetch_pictures(config):
     url = "https://www.bing.com/HPImageArchive.aspx?format=js&n=8&mkt={}"
     for lang in i18n_src:
         lang_url = "{}[0-9]{{10}}".format(lang.upper())
-        data = requests.get(url.format(lang)).json()
+        data = cached_get(url.format(lang), CACHE_TTL).json()
         for p in data["images"]:
             ad = re.sub(lang_url, "", p["url"])
             if ad in already_done:
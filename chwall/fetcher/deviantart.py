@@ -1,33 +1,77 @@
-import requests
 from lxml import html
 from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from chwall.fetcher import read_memo, write_memo
+from chwall.network import get_session
 
-def fetch_pictures(config):
+MEDIA_NS = "{http://search.yahoo.com/mrss/}"
+# Number of deviation pages scraped at the same time
+MAX_WORKERS = 4
+
+
+def clean_picture_url(url):
+    # Remove any resizing instruction to get the original picture
+    return url.split("/v1/fill/")[0]
+
+
+def scrap_picture_url(pic_page):
+    scrap = html.fromstring(get_session().get(pic_page).text)
+    meta = scrap.xpath('//meta[@property="og:image"]')[0]
+    return clean_picture_url(meta.attrib.get("content"))
+
+
+def picture_data(pic_url, item):
+    return {
+        "image": pic_url,
+        "type": "Deviantart",
+        "url": item.find("link").text,
+        "description": item.find("title").text,
+        "author": item.find("{}credit".format(MEDIA_NS)).text
+    }
+
+
+def iter_pictures(config):
     collecs = config.get("deviantart", {}).get("collections", [])
-    if len(collecs) == 0:
-        return {}
-    pictures = {}
     url = "https://backend.deviantart.com/rss.xml?type=deviation&q={}"
+    old_memo = read_memo("deviantart")
+    # Only keep pages still present in feeds
+    memo = {}
+    to_scrap = {}
     for q in collecs:
-        data = ElementTree.fromstring(requests.get(url.format(q)).text)
+        data = ElementTree.fromstring(get_session().get(url.format(q)).text)
         for item in data[0].findall("item"):
-            title = item.find("title").text
-            author = item.find(
-                        "{http://search.yahoo.com/mrss/}credit").text
             pic_page = item.find("link").text
-            scrap = html.fromstring(requests.get(pic_page).text)
-            meta = scrap.xpath('//meta[@property="og:image"]')[0]
-            pic_data = meta.attrib.get("content").split("/v1/fill/")
-            pic_url = pic_data[0]
-            pictures[pic_url] = {
-                "image": pic_url,
-                "type": "Deviantart",
-                "url": pic_page,
-                "description": title,
-                "author": author
-            }
-    return pictures
+            pic_url = None
+            for media in item.findall("{}content".format(MEDIA_NS)):
+                if media.attrib.get("medium") == "image":
+                    pic_url = clean_picture_url(media.attrib["url"])
+                    break
+            if pic_url is None:
+                pic_url = old_memo.get(pic_page)
+            if pic_url is None:
+                to_scrap[pic_page] = item
+                continue
+            memo[pic_page] = pic_url
+            yield pic_url, picture_data(pic_url, item)
+    if len(to_scrap) == 0:
+        write_memo("deviantart", memo)
+        return
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(scrap_picture_url, pic_page): pic_page
+                       for pic_page in to_scrap}
+            for future in as_completed(futures):
+                pic_page = futures[future]
+                pic_url = future.result()
+                memo[pic_page] = pic_url
+                yield pic_url, picture_data(pic_url, to_scrap[pic_page])
+    finally:
+        write_memo("deviantart", memo)
+
+
+def fetch_pictures(config):
+    return dict(iter_pictures(config))
 
 
 def preferences():
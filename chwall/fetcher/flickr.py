@@ -1,40 +1,76 @@
 import re
-import requests
 from lxml import html
 from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from chwall.fetcher import read_memo, write_memo
+from chwall.network import get_session
 
-def fetch_pictures(config):
+# Number of photos resolved at the same time. The session limits itself
+# the number of concurrent requests sent to Flickr.
+MAX_WORKERS = 8
+
+
+def best_size_url(pic_page):
+    # Bigger is best
+    for size in ["o", "k", "h"]:
+        scrap = html.fromstring(get_session().get(
+            "{}sizes/{}/".format(pic_page, size)).text)
+        pic_data = scrap.xpath('//div[@id="allsizes-photo"]/img')[0]
+        pic_url = pic_data.attrib.get("src")
+        if re.search("_{}\\.jpg$".format(size), pic_url) is not None:
+            break
+    return pic_url
+
+
+def picture_data(pic_url, item):
+    return {
+        "image": pic_url,
+        "type": "Flickr",
+        "url": item.find("link").text,
+        "description": item.find("title").text,
+        "author": item.find("{http://search.yahoo.com/mrss/}credit").text
+    }
+
+
+def iter_pictures(config):
     tag_list = config.get("flickr", {}).get("tags", [])
     if len(tag_list) == 0:
-        return {}
+        return
     tags = ",".join(list(map(lambda x: x.strip(), tag_list)))
     url = "https://api.flickr.com/services/feeds/photos_public.gne?" \
           "tagmode=any&tags={tags}&format=rss_200_enc".format(tags=tags)
-    pictures = {}
-    data = ElementTree.fromstring(requests.get(url).text)
+    data = ElementTree.fromstring(get_session().get(url).text)
+    old_memo = read_memo("flickr")
+    # Only keep photos still present in the feed
+    memo = {}
+    to_resolve = {}
     for item in data[0].findall("item"):
-        title = item.find("title").text
-        author = item.find("{http://search.yahoo.com/mrss/}credit").text
         pic_page = item.find("link").text
+        if pic_page in old_memo:
+            pic_url = old_memo[pic_page]
+            memo[pic_page] = pic_url
+            yield pic_url, picture_data(pic_url, item)
+        else:
+            to_resolve[pic_page] = item
+    if len(to_resolve) == 0:
+        write_memo("flickr", memo)
+        return
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(best_size_url, pic_page): pic_page
+                       for pic_page in to_resolve}
+            for future in as_completed(futures):
+                pic_page = futures[future]
+                pic_url = future.result()
+                memo[pic_page] = pic_url
+                yield pic_url, picture_data(pic_url, to_resolve[pic_page])
+    finally:
+        write_memo("flickr", memo)
 
-        # Bigger is best
-        for size in ["o", "k", "h"]:
-            scrap = html.fromstring(requests.get(
-                "{}sizes/{}/".format(pic_page, size)).text)
-            pic_data = scrap.xpath('//div[@id="allsizes-photo"]/img')[0]
-            pic_url = pic_data.attrib.get("src")
-            if re.search("_{}\\.jpg$".format(size), pic_url) is not None:
-                break
-
-        pictures[pic_url] = {
-            "image": pic_url,
-            "type": "Flickr",
-            "url": pic_page,
-            "description": title,
-            "author": author
-        }
-    return pictures
+
+def fetch_pictures(config):
+    return dict(iter_pictures(config))
 
 
 def preferences():
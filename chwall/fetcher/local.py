@@ -13,7 +13,7 @@ _ = gettext.gettext
 logger = get_logger(__name__)
 
 
-def fetch_pictures(config):
+def iter_pictures(config):
     conf = config.get("local", {})
     paths = conf.get("paths", [])
     include_fav = conf.get("favorites", True)
@@ -23,16 +23,13 @@ def fetch_pictures(config):
             paths.insert(0, fav_dir)
     except PermissionError as e:
         logger.error(e)
-    if len(paths) == 0:
-        return {}
-    pictures = {}
     for path in paths:
         path = os.path.expanduser(path)
         try:
             for ext in ["jpg", "jpeg", "png"]:
                 glob_path = "{}/*.{}".format(path, ext)
                 for f in glob.iglob(glob_path, recursive=True):
-                    pictures[f] = {
+                    yield f, {
                         "image": f,
                         "type": "local",
                         "url": f,
@@ -40,7 +37,10 @@ def fetch_pictures(config):
                     }
         except PermissionError as e:
             logger.error(e)
-    return pictures
+
+
+def fetch_pictures(config):
+    return dict(iter_pictures(config))
 
 
 def preferences():
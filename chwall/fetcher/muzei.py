@@ -1,6 +1,10 @@
 import json
 import datetime
-import requests
+
+from chwall.network import cached_get
+
+# Last month meta file does not change anymore
+CACHE_TTL = 7 * 86400
 
 
 def fetch_pictures(config):
@@ -15,7 +19,7 @@ def fetch_pictures(config):
     # that's sufficient.
     metafile = "{year}{month:0>2}.txt".format(year=year, month=month)
     baseuri = "https://storage.googleapis.com/muzeifeaturedart/archivemeta"
-    rawdata = requests.get("{}/{}".format(baseuri, metafile)).text
+    rawdata = cached_get("{}/{}".format(baseuri, metafile), CACHE_TTL).text
     # Only the first line is interesting
     data = json.loads(rawdata.split("\n", 1)[0])
     pictures = {}
@@ -1,30 +1,83 @@
 import re
-import time
-import requests
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from chwall.fetcher import read_memo, write_memo
+from chwall.network import get_session
 
-def fetch_pictures(config):
-    pictures = {}
+# Number of day pages fetched at the same time
+MAX_WORKERS = 5
+
+
+def resolve_day(day):
+    """Return the APOD page of the given day and its picture address.
+
+    The picture address is None when there is no picture that day (a video
+    for example), and False when the page could not be retrieved.
+    """
+    pic_page = "https://apod.nasa.gov/apod/ap{}.html".format(
+        day.strftime("%y%m%d"))
+    resp = get_session().get(pic_page)
+    if resp.status_code != 200:
+        return pic_page, False
+    m = re.search("^<a href=\"(image/[0-9]{4}/.+)\">$",
+                  resp.text, re.MULTILINE)
+    if m is None:
+        return pic_page, None
+    return pic_page, "https://apod.nasa.gov/apod/{}".format(m[1])
+
+
+def iter_pictures(config):
     nb_pic = config.get("nasa", {}).get("count", 10)
-    curday = time.time()
-    for i in range(nb_pic):
-        pic_page = "https://apod.nasa.gov/apod/ap{}.html".format(
-            time.strftime("%y%m%d", time.localtime(curday)))
-        # Go to yesterday
-        curday = curday - 86400
-        data = requests.get(pic_page).text
-        m = re.search("^<a href=\"(image/[0-9]{4}/.+)\">$",
-                      data, re.MULTILINE)
-        if m is None:
+    today = date.today()
+    days = [today - timedelta(days=i) for i in range(nb_pic)]
+    # A past day page never changes, thus each result is kept forever.
+    # Today's one may not be published yet.
+    memo = read_memo("nasa")
+    unknown_days = []
+    for day in days:
+        day_id = day.strftime("%y%m%d")
+        if day_id not in memo:
+            unknown_days.append(day)
+            continue
+        if memo[day_id] is None:
             continue
-        url = "https://apod.nasa.gov/apod/{}".format(m[1])
-        pictures[url] = {
+        pic_page, url = memo[day_id]
+        yield url, {
             "image": url,
             "type": "NASA",
             "url": pic_page,
             "copyright": "Astronomy Picture Of The Day"
         }
-    return pictures
+    if len(unknown_days) == 0:
+        return
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(resolve_day, day): day
+                       for day in unknown_days}
+            for future in as_completed(futures):
+                day = futures[future]
+                pic_page, url = future.result()
+                if url is False:
+                    continue
+                if day != today:
+                    memo[day.strftime("%y%m%d")] = (
+                        None if url is None else [pic_page, url]
+                    )
+                if url is None:
+                    continue
+                yield url, {
+                    "image": url,
+                    "type": "NASA",
+                    "url": pic_page,
+                    "copyright": "Astronomy Picture Of The Day"
+                }
+    finally:
+        write_memo("nasa", memo)
+
+
+def fetch_pictures(config):
+    return dict(iter_pictures(config))
 
 
 def preferences():
@@ -1,6 +1,10 @@
-import requests
 from datetime import date
 
+from chwall.network import cached_get
+
+# Last month page does not change anymore
+CACHE_TTL = 7 * 86400
+
 
 def fetch_pictures(config):
     pictures = {}
@@ -16,9 +20,9 @@ def fetch_pictures(config):
     month = month_label[month_idx]
     final_uri = "https://www.nationalgeographic.co.uk/page-data/" \
         f"photo-of-the-day/{year}/{month}/page-data.json"
-    data = requests.get(final_uri).json() \
-                   .get("result", {}).get("pageContext", {}) \
-                   .get("node", {}).get("data", {}).get("content", {})
+    data = cached_get(final_uri, CACHE_TTL).json() \
+        .get("result", {}).get("pageContext", {}) \
+        .get("node", {}).get("data", {}).get("content", {})
     pic_url = "https://www.nationalgeographic.co.uk/photo-of-the-day/" \
         f"{year}/{month}?image="
     for p in data.get("images", []):
@@ -1,6 +1,5 @@
-import requests
-
 from chwall.utils import get_logger
+from chwall.network import get_session
 
 import gettext
 # Uncomment the following line during development.
@@ -29,7 +28,7 @@ def fetch_pictures(config):
     else:
         url = "https://api.pexels.com/v1/curated"
     pictures = {}
-    data = requests.get(
+    data = get_session().get(
         url,
         params=params,
         headers={"Authorization": client_id}
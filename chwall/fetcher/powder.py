@@ -1,6 +1,7 @@
-import requests
 from lxml import html
 
+from chwall.network import get_session
+
 
 def fetch_pictures(config):
     pictures = {}
@@ -8,7 +9,7 @@ def fetch_pictures(config):
     if width not in [320, 640, 970, 1920]:
         width = 1920
     data = html.fromstring(
-        requests.get("https://www.powder.com/photo-of-the-day/").text)
+        get_session().get("https://www.powder.com/photo-of-the-day/").text)
     for item in data.cssselect("article.hentry img.entry-image"):
         pics = item.attrib["data-srcset"]
         if pics is None or pics == "":
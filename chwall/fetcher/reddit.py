@@ -1,7 +1,6 @@
 import re
-import requests
 
-from chwall import __version__
+from chwall.network import get_session
 
 import gettext
 # Uncomment the following line during development.
@@ -18,9 +17,7 @@ def fetch_pictures(config):
     pictures = {}
     url = "https://www.reddit.com/r/{}.json?raw_json=1".format(
         "+".join(list(map(lambda x: x.strip(), subreds))))
-    uagent = "python:Chwall:v{version} (by /u/milouse)".format(
-        version=__version__)
-    data = requests.get(url, headers={"user-agent": uagent}).json()
+    data = get_session().get(url).json()
     collecs = data.get("data", {}).get("children", [])
     for p in collecs:
         if p["data"].get("post_hint") != "image":
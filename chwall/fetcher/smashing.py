@@ -1,8 +1,9 @@
 import re
-import requests
 from datetime import date
 from xml.etree import ElementTree
 
+from chwall.network import cached_get
+
 import gettext
 # Uncomment the following line during development.
 # Please, be cautious to NOT commit the following line uncommented.
@@ -10,6 +11,8 @@ import gettext
 gettext.textdomain("chwall")
 _ = gettext.gettext
 
+CACHE_TTL = 86400
+
 
 def fetch_pictures(config):
     pictures = {}
@@ -35,7 +38,7 @@ def fetch_pictures(config):
             month_re=month_re, size_re=size_re
         )
     )
-    xml_data = ElementTree.fromstring(requests.get(feed).text)
+    xml_data = ElementTree.fromstring(cached_get(feed, CACHE_TTL).text)
     for item in xml_data[0].findall("item"):
         pic_page = item.find("link").text
         content = item.find(
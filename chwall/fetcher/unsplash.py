@@ -1,6 +1,5 @@
-import requests
-
 from chwall.utils import get_logger
+from chwall.network import get_session
 
 import gettext
 # Uncomment the following line during development.
@@ -33,7 +32,7 @@ def fetch_pictures(config):
     params.append("client_id=" + client_id)
     pictures = {}
     final_uri = "{}?{}".format(url, "&".join(params))
-    data = requests.get(final_uri).json()
+    data = get_session().get(final_uri).json()
     for p in data:
         px = "{u}&w={w}".format(u=p["urls"]["raw"], w=width)
         if p["description"] is None:
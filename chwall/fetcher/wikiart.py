@@ -1,7 +1,7 @@
 import os
-import requests
 
 from chwall.utils import get_logger
+from chwall.network import get_session
 
 import gettext
 # Uncomment the following line during development.
@@ -31,9 +31,9 @@ def fetch_pictures(config):
         return {}
     locale = wa_conf.get("locale", "en")
     base_uri = "https://www.wikiart.org/{}/Api/2/".format(locale)
-    log_data = requests.get("{}login".format(base_uri),
-                            params={"accessCode": access_key,
-                                    "secretCode": secret_key}).json()
+    log_data = get_session().get("{}login".format(base_uri),
+                                 params={"accessCode": access_key,
+                                         "secretCode": secret_key}).json()
     session_key = log_data.get("SessionKey")
     if session_key is None:
         logger.error(
@@ -50,8 +50,8 @@ def fetch_pictures(config):
     if query is not None and query != "":
         endpoint = "PaintingSearch"
         payload["term"] = query
-    data = requests.get("{}{}".format(base_uri, endpoint),
-                        params=payload).json()
+    data = get_session().get("{}{}".format(base_uri, endpoint),
+                             params=payload).json()
     pictures = {}
     for pic in data["data"]:
         url = pic["image"]
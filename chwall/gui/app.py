@@ -6,7 +6,8 @@ import signal
 
 from chwall.gui.shared import ChwallGui
 from chwall.wallpaper import current_wallpaper_info
-from chwall.utils import get_binary_path, reset_pending_list
+from chwall.roadmap import reset_pending_list
+from chwall.utils import get_binary_path
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -1,9 +1,8 @@
-import pkgutil
-from importlib import import_module
-
-from chwall.utils import read_config, write_config, reset_pending_list, \
-                         count_broken_pictures_in_cache, cleanup_cache, \
-                         compute_cache_size, ServiceFileManager
+from chwall.fetcher import fetchers_manifest
+from chwall.roadmap import reset_pending_list
+from chwall.utils import read_config, write_config, ServiceFileManager
+from chwall.cache import count_broken_pictures_in_cache, cleanup_cache, \
+                         compute_cache_size
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -134,10 +133,9 @@ class PrefDialog(Gtk.Dialog):
         box.pack_start(stack, True, True, 0)
         self.show_all()
 
-    def add_source_panel(self, fetcher_name, fetcher):
+    def add_source_panel(self, fetcher_name, fprefs):
         sourceprefbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
         sourceprefbox.set_spacing(10)
-        fprefs = fetcher.preferences()
         prefbox = self.make_fetcher_toggle_pref(fetcher_name, fprefs)
         sourceprefbox.pack_start(prefbox, False, False, 0)
         if "options" not in fprefs:
@@ -167,8 +165,8 @@ class PrefDialog(Gtk.Dialog):
             if options["widget"] == "select":
                 values = []
                 for v in options["values"]:
-                    if isinstance(v, tuple):
-                        values.append(v)
+                    if isinstance(v, (tuple, list)):
+                        values.append(tuple(v))
                     else:
                         values.append((str(v), str(v)))
                 prefbox = self.make_select_pref(
@@ -431,13 +429,8 @@ class PrefDialog(Gtk.Dialog):
     def make_sources_pane(self):
         self.sources_stack = Gtk.Stack()
 
-        fetcher_package = import_module("chwall.fetcher")
-        fp_source = fetcher_package.__path__
-        for fd in pkgutil.iter_modules(fp_source):
-            fetcher = import_module("chwall.fetcher.{}".format(fd.name))
-            if "preferences" not in dir(fetcher):
-                continue
-            self.add_source_panel(fd.name, fetcher)
+        for name, fetcher in fetchers_manifest().items():
+            self.add_source_panel(name, fetcher["preferences"])
 
         sources_switcher = Gtk.StackSidebar()
         sources_switcher.set_stack(self.sources_stack)
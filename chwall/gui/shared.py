@@ -4,7 +4,7 @@ import subprocess
 
 from chwall import __version__
 from chwall.daemon import notify_daemon_if_any, notify_app_if_any, daemon_info
-from chwall.utils import read_config, cleanup_cache
+from chwall.utils import read_config
 from chwall.wallpaper import blacklist_wallpaper, pick_wallpaper, \
     favorite_wallpaper_path, favorite_wallpaper
 from chwall.gui.preferences import PrefDialog
@@ -0,0 +1,100 @@
+import os
+import time
+import yaml
+import threading
+
+# chwall imports
+from chwall.utils import BASE_CACHE_PATH
+
+import gettext
+# Uncomment the following line during development.
+# Please, be cautious to NOT commit the following line uncommented.
+# gettext.bindtextdomain("chwall", "./locale")
+gettext.textdomain("chwall")
+_ = gettext.gettext
+
+
+HEALTH_FILE = "{}/sources_health.yml".format(BASE_CACHE_PATH)
+# Number of consecutive failures after which a source is skipped
+FAILURE_THRESHOLD = 3
+# Time during which a failing source is skipped. It doubles after each new
+# failed probe, up to COOLDOWN_MAX.
+COOLDOWN_BASE = 30 * 60
+COOLDOWN_MAX = 24 * 3600
+
+
+def read_sources_health():
+    try:
+        with open(HEALTH_FILE, "r") as f:
+            return yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError):
+        return {}
+
+
+def write_sources_health(health):
+    # The background refill and a roadmap build may write it at once
+    tmp_file = "{}.{}.{}".format(HEALTH_FILE, os.getpid(),
+                                 threading.get_ident())
+    with open(tmp_file, "w") as f:
+        yaml.dump(health, f, explicit_start=True, default_flow_style=False)
+    os.replace(tmp_file, HEALTH_FILE)
+
+
+def source_cooldown(record):
+    extra_failures = max(0, record.get("failures", 0) - FAILURE_THRESHOLD)
+    return min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** extra_failures)
+
+
+def source_state(record, now=None):
+    """Return the circuit breaker state of a source health record.
+
+    A source is ``closed`` (working) until it fails FAILURE_THRESHOLD times
+    in a row. It is then ``open`` (skipped) for a cooldown period, after
+    which it becomes ``half-open``: it will be probed once during the next
+    build, and go back to ``closed`` on success or ``open`` on failure.
+    """
+    if record is None or record.get("failures", 0) < FAILURE_THRESHOLD:
+        return "closed"
+    if now is None:
+        now = time.time()
+    if now - record.get("last_failure", 0) < source_cooldown(record):
+        return "open"
+    return "half-open"
+
+
+def record_source_result(health, name, success, now=None):
+    if now is None:
+        now = time.time()
+    record = health.setdefault(name, {"failures": 0, "last_success": None})
+    if success:
+        record["failures"] = 0
+        record["last_success"] = int(now)
+    else:
+        record["failures"] = record.get("failures", 0) + 1
+        record["last_failure"] = int(now)
+    return record
+
+
+def sources_health_labels(sources):
+    health = read_sources_health()
+    now = time.time()
+    labels = []
+    for name in sources:
+        record = health.get(name)
+        state = source_state(record, now)
+        if state == "closed":
+            label = _("working")
+        elif state == "open":
+            retry_in = int(record["last_failure"] + source_cooldown(record)
+                           - now)
+            label = _("failing, skipped for {minutes} more minutes").format(
+                minutes=retry_in // 60 + 1)
+        else:
+            label = _("failing, will be tried again during next update")
+        if record is not None and record.get("last_success") is not None:
+            last_success = time.strftime(
+                "%c", time.localtime(record["last_success"]))
+            label = _("{state} (last success on {date})").format(
+                state=label, date=last_success)
+        labels.append((name, label))
+    return labels
@@ -0,0 +1,512 @@
+import os
+import json
+import fcntl
+import time
+import yaml
+import random
+import hashlib
+import threading
+import requests
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# chwall imports
+from chwall import __version__
+from chwall.utils import BASE_CACHE_PATH, file_checksum, get_logger
+
+import gettext
+# Uncomment the following line during development.
+# Please, be cautious to NOT commit the following line uncommented.
+# gettext.bindtextdomain("chwall", "./locale")
+gettext.textdomain("chwall")
+_ = gettext.gettext
+
+logger = get_logger(__name__)
+
+
+USER_AGENT = "python:Chwall:v{version} (by /u/milouse)"
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+# Number of kept alive connections for each remote host
+POOL_SIZE = 10
+# Number of requests sent at the same time to a given remote host
+MAX_REQUESTS_PER_HOST = 4
+RETRY_ATTEMPTS = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+# ChunkedEncodingError is raised when a response body is cut before its end
+RETRY_ERRORS = (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.HTTPError,
+                requests.exceptions.Timeout)
+HTTP_CACHE_PATH = "{}/http".format(BASE_CACHE_PATH)
+# Default time during which a cached response is used without asking
+# the remote server
+CACHE_TTL = 3600
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Default maximum size of a downloaded picture, in bytes
+MAX_DOWNLOAD_SIZE = 100 * 1024 * 1024
+# Received bytes are kept in a file with this suffix until the download is
+# complete, along with the state needed to resume it.
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".yml"
+# Files smaller than that are never split in several ranges
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# Progress of a segmented download is saved each time that many bytes have
+# been received.
+STATE_SAVE_INTERVAL = 1024 * 1024
+
+
+class DownloadFailed(Exception):
+    pass
+
+
+class DownloadTooLarge(DownloadFailed):
+    pass
+
+
+class _RemoteFileChanged(Exception):
+    pass
+
+
+def _raise_for_server_error(response, *args, **kwargs):
+    # Client errors (like 404) are left to the caller, which generally
+    # knows what to do with them. Server errors and rate limiting are
+    # transient and must be retried.
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+
+
+class ChwallSession(requests.Session):
+    """HTTP session shared by all chwall components.
+
+    It keeps a pool of alive connections for each remote host, sends the
+    chwall User-Agent and sets a default timeout to every request. It also
+    limits the number of concurrent requests to a given host, in order not
+    to hammer it when many threads are fetching pages from it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.headers["User-Agent"] = USER_AGENT.format(version=__version__)
+        self.hooks["response"].append(_raise_for_server_error)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE,
+                              pool_maxsize=POOL_SIZE)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    MAX_REQUESTS_PER_HOST)
+            return self._host_slots[host]
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        with self._host_slot(url):
+            return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process wide HTTP session.
+
+    All fetchers and the picture downloader must use it to benefit from
+    connection reuse.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = ChwallSession()
+        return _session
+
+
+def backoff_delay(attempt):
+    """Return the time to wait before the given retry attempt.
+
+    The delay grows exponentially with the attempt number, and is
+    randomized ("full jitter") to avoid all failing requests to hit the
+    same remote server again at the same moment.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def with_retry(func, target, deadline=None, attempts=RETRY_ATTEMPTS):
+    """Call func until it succeeds or attempts are exhausted.
+
+    Only network errors are retried. The last one is raised again when
+    no attempt remains or when waiting once more would go beyond the
+    given deadline (as returned by ``time.monotonic``).
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except RETRY_ERRORS as e:
+            attempt += 1
+            delay = backoff_delay(attempt)
+            out_of_time = (deadline is not None and
+                           time.monotonic() + delay > deadline)
+            if attempt >= attempts or out_of_time:
+                raise
+            logger.error(
+                _("Catch {error} exception while retrieving {target}. "
+                  "Wait {time} seconds before retrying.")
+                .format(error=type(e).__name__, target=target,
+                        time=round(delay, 1))
+            )
+            time.sleep(delay)
+
+
+class CachedResponse:
+    """Minimal response-like object built from the HTTP cache."""
+
+    def __init__(self, content, encoding, from_cache=True):
+        self.content = content
+        self.encoding = encoding or "utf-8"
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _cache_key(url, params):
+    key = url
+    if params:
+        key += "?" + "&".join(
+            "{}={}".format(k, v) for k, v in sorted(params.items())
+        )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _read_cache_entry(key):
+    meta_file = "{}/{}.yml".format(HTTP_CACHE_PATH, key)
+    try:
+        with open(meta_file, "r") as f:
+            meta = yaml.safe_load(f) or {}
+        with open("{}/{}".format(HTTP_CACHE_PATH, key), "rb") as f:
+            content = f.read()
+    except (FileNotFoundError, yaml.YAMLError):
+        return None, None
+    return meta, content
+
+
+def _write_cache_entry(key, meta, content=None):
+    os.makedirs(HTTP_CACHE_PATH, exist_ok=True)
+    base = "{}/{}".format(HTTP_CACHE_PATH, key)
+    # Write in temporary files first, as another thread or process may
+    # read the same entry at the same time.
+    suffix = ".{}.{}.tmp".format(os.getpid(), threading.get_ident())
+    if content is not None:
+        with open(base + suffix, "wb") as f:
+            f.write(content)
+        os.replace(base + suffix, base)
+    with open(base + ".yml" + suffix, "w") as f:
+        yaml.dump(meta, f, explicit_start=True, default_flow_style=False)
+    os.replace(base + ".yml" + suffix, base + ".yml")
+
+
+def cached_get(url, ttl=CACHE_TTL, params=None, **kwargs):
+    """Fetch url through the on-disk HTTP cache.
+
+    A cached response younger than ttl seconds is returned without any
+    network access. An older one is revalidated with its ETag or
+    Last-Modified value. If the remote server cannot be reached or
+    fails, the stale cached response is returned instead, if any.
+
+    The returned object exposes ``content``, ``text`` and ``json()``,
+    like a ``requests.Response``.
+    """
+    key = _cache_key(url, params)
+    meta, content = _read_cache_entry(key)
+    now = time.time()
+    if meta is not None and now - meta.get("fetched_at", 0) < ttl:
+        return CachedResponse(content, meta.get("encoding"))
+    headers = kwargs.pop("headers", {}).copy()
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        resp = get_session().get(url, params=params, headers=headers,
+                                 **kwargs)
+    except RETRY_ERRORS as e:
+        if meta is None:
+            raise
+        logger.warning(
+            _("Catch {error} exception while retrieving {target}. "
+              "Using cached version instead.")
+            .format(error=type(e).__name__, target=url)
+        )
+        return CachedResponse(content, meta.get("encoding"))
+    if resp.status_code == 304 and meta is not None:
+        meta["fetched_at"] = now
+        _write_cache_entry(key, meta)
+        return CachedResponse(content, meta.get("encoding"))
+    if resp.status_code != 200:
+        if meta is not None:
+            return CachedResponse(content, meta.get("encoding"))
+        return resp
+    meta = {
+        "url": url,
+        "fetched_at": now,
+        "encoding": resp.encoding,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified")
+    }
+    _write_cache_entry(key, meta, resp.content)
+    return CachedResponse(resp.content, resp.encoding, False)
+
+
+class DownloadLock:
+    """Exclusive lock on the download of a given file.
+
+    It prevents other threads (like the prefetcher) and other chwall
+    processes to download the same file at the same time. The lock is held
+    on the partial file itself, which path is returned when entering the
+    lock. An empty partial file is removed when the lock is released.
+    """
+
+    def __init__(self, path):
+        self.part_file = path + PART_SUFFIX
+        self._lock_file = None
+
+    def __enter__(self):
+        while True:
+            self._lock_file = open(self.part_file, "ab")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            # The previous owner may have removed or renamed the partial
+            # file while we were waiting for it.
+            try:
+                current = os.stat(self.part_file).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(self._lock_file.fileno()).st_ino:
+                return self.part_file
+            self._lock_file.close()
+
+    def __exit__(self, *exc_info):
+        try:
+            if os.path.getsize(self.part_file) == 0:
+                os.unlink(self.part_file)
+        except FileNotFoundError:
+            pass
+        self._lock_file.close()
+        self._lock_file = None
+
+
+def _read_download_state(path):
+    try:
+        with open(path + STATE_SUFFIX, "r") as f:
+            return yaml.safe_load(f) or {}
+    except (FileNotFoundError, yaml.YAMLError):
+        return {}
+
+
+def _write_download_state(path, state):
+    state_file = path + STATE_SUFFIX
+    tmp_file = "{}.{}.{}.tmp".format(state_file, os.getpid(),
+                                     threading.get_ident())
+    with open(tmp_file, "w") as f:
+        yaml.dump(state, f, explicit_start=True, default_flow_style=False)
+    os.replace(tmp_file, state_file)
+
+
+def discard_download(path):
+    """Remove the received bytes of path and its download state."""
+    for leftover in [path, path + STATE_SUFFIX]:
+        if os.path.exists(leftover):
+            os.unlink(leftover)
+
+
+def _content_length(resp, max_size):
+    # Return the size of the whole remote file, if known
+    if resp.headers.get("Content-Encoding") is not None:
+        # Content-Length is the one of the encoded content
+        return None
+    if resp.status_code == 206:
+        # Content-Range: bytes 100-199/200
+        length = resp.headers.get("Content-Range", "").rpartition("/")[2]
+    else:
+        length = resp.headers.get("Content-Length", "")
+    if not length.isdigit():
+        return None
+    if int(length) > max_size:
+        raise DownloadTooLarge(resp.url)
+    return int(length)
+
+
+def _range_start(resp):
+    # Content-Range: bytes 100-199/200
+    first = resp.headers.get("Content-Range", "").partition("-")[0]
+    first = first.rpartition(" ")[2]
+    return int(first) if first.isdigit() else None
+
+
+def _fetch_segment(url, path, segment, state, lock):
+    start, end = segment[0] + segment[2], segment[1]
+    if start > end:
+        return
+    headers = {"Range": "bytes={}-{}".format(start, end),
+               "If-Range": state["validator"]}
+    with get_session().get(url, headers=headers, stream=True) as resp:
+        if resp.status_code >= 400 and resp.status_code != 416:
+            raise DownloadFailed("{} {}".format(resp.status_code, url))
+        if resp.status_code != 206 or _range_start(resp) != start:
+            raise _RemoteFileChanged()
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            unsaved = 0
+            for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                chunk = chunk[:end + 1 - start]
+                os.pwrite(fd, chunk, start)
+                start += len(chunk)
+                unsaved += len(chunk)
+                with lock:
+                    segment[2] += len(chunk)
+                    if unsaved >= STATE_SAVE_INTERVAL:
+                        _write_download_state(path, state)
+                        unsaved = 0
+                if start > end:
+                    break
+        finally:
+            os.close(fd)
+    if start <= end:
+        raise requests.exceptions.ConnectionError(
+            "Connection closed before the end of {}".format(url))
+
+
+def _download_segments(url, path, state):
+    lock = threading.Lock()
+    try:
+        with ThreadPoolExecutor(len(state["segments"])) as executor:
+            futures = [
+                executor.submit(_fetch_segment, url, path, seg, state, lock)
+                for seg in state["segments"]
+            ]
+            for future in futures:
+                future.result()
+    except BaseException:
+        # Save progress, to resume from there next time
+        with lock:
+            _write_download_state(path, state)
+        raise
+    os.unlink(path + STATE_SUFFIX)
+    return file_checksum(path), state["length"]
+
+
+def _split_download(url, path, length, validator, segments):
+    size = -(-length // segments)
+    state = {
+        "url": url,
+        "validator": validator,
+        "length": length,
+        "segments": [[start, min(start + size, length) - 1, 0]
+                     for start in range(0, length, size)]
+    }
+    with open(path, "wb") as f:
+        f.truncate(length)
+    _write_download_state(path, state)
+    return _download_segments(url, path, state)
+
+
+def download(url, path, max_size=MAX_DOWNLOAD_SIZE, segments=1):
+    """Download url into path and return its SHA-256 sum and size.
+
+    The content is streamed to disk by chunks, never fully kept in memory.
+    DownloadTooLarge is raised as soon as it appears to be bigger than
+    max_size bytes, and DownloadFailed when the remote server answers with
+    a client error (the picture is gone). Received bytes are then removed.
+
+    On network errors, they are kept instead, along with the ETag or
+    Last-Modified value of the remote file. The next call (even from
+    another process) only asks the missing bytes with a Range request, if
+    the remote file did not change in the meantime. Files bigger than
+    MIN_SEGMENT_SIZE are fetched with at most segments parallel Range
+    requests, when the server supports it.
+
+    path should thus be a partial file, locked with DownloadLock and moved
+    to its final place by the caller.
+    """
+    state = _read_download_state(path)
+    if state.get("url") != url:
+        state = {}
+    try:
+        if state.get("segments"):
+            try:
+                return _download_segments(url, path, state)
+            except _RemoteFileChanged:
+                discard_download(path)
+                state = {}
+        return _download(url, path, max_size, segments, state)
+    except DownloadFailed:
+        discard_download(path)
+        raise
+    except _RemoteFileChanged:
+        # Start again from scratch on next attempt
+        discard_download(path)
+        raise requests.exceptions.ConnectionError(
+            "{} changed during its download".format(url))
+
+
+def _download(url, path, max_size, segments, state):
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    headers = {}
+    if offset > 0 and state.get("validator"):
+        headers["Range"] = "bytes={}-".format(offset)
+        headers["If-Range"] = state["validator"]
+    with get_session().get(url, headers=headers, stream=True) as resp:
+        if resp.status_code == 416 or (
+                resp.status_code == 206 and _range_start(resp) != offset):
+            # Received bytes do not match the remote file anymore
+            resp.close()
+            discard_download(path)
+            return _download(url, path, max_size, segments, {})
+        if resp.status_code >= 400:
+            raise DownloadFailed("{} {}".format(resp.status_code, url))
+        length = _content_length(resp, max_size)
+        validator = (resp.headers.get("ETag")
+                     or resp.headers.get("Last-Modified"))
+        if resp.status_code != 206:
+            # Whole file is coming, previous bytes are useless
+            offset = 0
+            if (segments > 1 and validator is not None
+                    and length is not None and length >= MIN_SEGMENT_SIZE
+                    and resp.headers.get("Accept-Ranges") == "bytes"):
+                resp.close()
+                return _split_download(url, path, length, validator,
+                                       min(segments, MAX_REQUESTS_PER_HOST))
+        _write_download_state(path, {"url": url, "validator": validator})
+        # Content is hashed on the fly, unless previous bytes must be read
+        # again anyway.
+        check = hashlib.sha256() if offset == 0 else None
+        size = offset
+        with open(path, "ab" if offset > 0 else "wb") as f:
+            for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise DownloadTooLarge(url)
+                if check is not None:
+                    check.update(chunk)
+                f.write(chunk)
+    if length is not None and size < length:
+        # Keep received bytes for the next attempt
+        raise requests.exceptions.ConnectionError(
+            "Connection closed before the end of {}".format(url))
+    os.unlink(path + STATE_SUFFIX)
+    if check is None:
+        return file_checksum(path), size
+    return check.hexdigest(), size
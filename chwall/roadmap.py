@@ -0,0 +1,726 @@
+import os
+import sys
+import yaml
+import random
+import bisect
+import hashlib
+import sqlite3
+
+# chwall imports
+from chwall.utils import BASE_CACHE_PATH, get_logger, roadmap_lock
+
+import gettext
+# Uncomment the following line during development.
+# Please, be cautious to NOT commit the following line uncommented.
+# gettext.bindtextdomain("chwall", "./locale")
+gettext.textdomain("chwall")
+_ = gettext.gettext
+
+logger = get_logger(__name__)
+
+
+ROADMAP_DB = "{}/roadmap.db".format(BASE_CACHE_PATH)
+# Former YAML roadmap, imported on first use
+LEGACY_ROADMAP = "{}/roadmap".format(BASE_CACHE_PATH)
+
+# Values of the state column of the pictures table
+WAITING = 0
+PENDING = 1
+SHOWN = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS pictures (
+    idx INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    state INTEGER NOT NULL DEFAULT 0,
+    source INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    pool INTEGER
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    url TEXT PRIMARY KEY,
+    page TEXT,
+    rights TEXT,
+    description TEXT,
+    author TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pictures_state ON pictures (state);
+CREATE INDEX IF NOT EXISTS pictures_pool ON pictures (pool);
+CREATE TABLE IF NOT EXISTS batches (
+    position INTEGER PRIMARY KEY,
+    start INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    seed INTEGER,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    pool INTEGER,
+    front INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS batches_pool ON batches (pool, position);
+CREATE TABLE IF NOT EXISTS history (
+    position INTEGER PRIMARY KEY,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_url ON history (url);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+SCHEMA_VERSION = 1
+# Columns of the pictures table needed to build a RoadmapEntry. The other
+# information about a picture, only needed to display it, is kept in the
+# metadata table.
+ENTRY_COLUMNS = ("url", "source", "path", "pool")
+# Default number of kept history entries
+HISTORY_SIZE = 500
+
+
+def picture_cache_path(image, source):
+    """Return the path of the cached copy of a remote picture."""
+    if source == "local":
+        return image
+    m = hashlib.md5()
+    m.update(image.encode())
+    return "{}/pictures/{}-{}".format(BASE_CACHE_PATH, source, m.hexdigest())
+
+
+class RoadmapEntry:
+    """Information about a known picture.
+
+    Its attributes match the keys of the dictionaries returned by the
+    fetchers. Source names are interned, thus shared by all the entries of
+    a source. The path of the picture in cache is computed once, and then
+    stored in the roadmap along with the other information. The pool is
+    the name of the fetcher, which returned the picture.
+    """
+
+    __slots__ = ("image", "type", "url", "copyright", "description",
+                 "author", "_path", "pool")
+
+    def __init__(self, image, type, url=None, copyright=None,
+                 description=None, author=None, path=None, pool=None):
+        self.image = image
+        self.pool = pool
+        self.type = sys.intern(type)
+        self.url = url
+        self.copyright = copyright
+        self.description = description
+        self.author = author
+        self._path = path
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = picture_cache_path(self.image, self.type)
+        return self._path
+
+    @classmethod
+    def from_data(cls, image, data, pool=None):
+        """Build an entry from the picture data returned by a fetcher."""
+        if isinstance(data, cls):
+            return data
+        return cls(data.get("image", image), data["type"], data.get("url"),
+                   data.get("copyright"), data.get("description"),
+                   data.get("author"), pool=pool)
+
+    def to_data(self):
+        data = {"image": self.image, "type": self.type}
+        for key in ["url", "copyright", "description", "author"]:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+
+FEISTEL_ROUNDS = 4
+MASK64 = (1 << 64) - 1
+
+
+def _mix(value):
+    # splitmix64 finalizer
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & MASK64
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & MASK64
+    return value ^ (value >> 31)
+
+
+def weighted_choice(rng, weights):
+    """Return a key of weights, drawn according to its weight.
+
+    Keys with a null weight are only drawn when all of them have one.
+    """
+    keys = sorted(weights, key=lambda k: (k is not None, k))
+    total = 0
+    cumulated = []
+    for key in keys:
+        total += max(weights[key], 0)
+        cumulated.append(total)
+    if total == 0:
+        return keys[int(rng.random() * len(keys))]
+    return keys[bisect.bisect_right(cumulated, rng.random() * total)]
+
+
+def permute(index, size, seed):
+    """Return the position at which index is moved by a seeded shuffle.
+
+    For a given size and seed, this function is a bijection of
+    ``range(size)``. It relies on a small Feistel network, applied again
+    until the result falls into the range ("cycle walking"). Thus any
+    element of a shuffled sequence can be found without storing the
+    whole shuffled sequence. A ``None`` seed keeps the original order.
+    """
+    if seed is None or size < 2:
+        return index
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    half_mask = (1 << half_bits) - 1
+    value = index
+    while True:
+        left, right = value >> half_bits, value & half_mask
+        for rnd in range(FEISTEL_ROUNDS):
+            key = (seed + rnd * 0x9e3779b97f4a7c15) & MASK64
+            left, right = right, left ^ (_mix(right ^ key) & half_mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+class Roadmap:
+    """Storage of the pictures to display.
+
+    The roadmap is made of three parts: the information about each known
+    picture, the order of pending pictures and the history of the already
+    displayed ones. It is stored in a SQLite database, which can be used at
+    the same time by the daemon, the client and the gui. Each modifying
+    method runs in its own transaction, unless it is called inside a
+    ``with`` block, which commits everything at once.
+
+    Each picture receives an increasing index when it is queued. The
+    pending order is then stored as a list of batches: a range of indexes,
+    the seed of a pseudo-random permutation of this range and a cursor.
+    Thus queuing a million of pictures only stores their information, and
+    finding the next one is a matter of computing a permutation.
+
+    Each source has its own batches (its pool). The next picture is taken
+    from a pool drawn according to the weights given at creation, indexed
+    by source name (1 by default). Thus a source with few pictures is not
+    hidden by a large one. Draws are reproducible, such that the coming
+    pictures can be listed in advance. Only the
+    information needed to order and cache pictures is read while doing so:
+    the rest of it (credits, web page...) is only read for the picture
+    actually returned.
+
+    :Example:
+
+    road_map = Roadmap()
+    with road_map:
+        road_map.store_pictures(pictures)
+        road_map.append_pending(urls)
+    road_map.close()
+    """
+
+    def __init__(self, weights=None):
+        self.weights = weights or {}
+        self.conn = sqlite3.connect(ROADMAP_DB, timeout=30,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._depth = 0
+        self._source_ids = {}
+        self._source_names = {}
+        with self:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self._create_tables()
+        if os.path.exists(LEGACY_ROADMAP):
+            self.import_yaml_roadmap(LEGACY_ROADMAP)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        if self._depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+            # Sources may have been created during the transaction
+            self._source_ids.clear()
+            self._source_names.clear()
+
+    def _create_tables(self):
+        # executescript would commit the current transaction
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                self.conn.execute(statement)
+        self.conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    def import_yaml_roadmap(self, path):
+        with roadmap_lock:
+            if not os.path.exists(path):
+                # Already imported by another process
+                return
+            try:
+                with open(path, "r") as f:
+                    data = yaml.safe_load(f) or {}
+            except yaml.YAMLError:
+                data = {}
+            with self:
+                self.store_pictures(data.get("data", {}))
+                history = data.get("history", [])
+                self.conn.executemany(
+                    "INSERT INTO history (url) VALUES (?)",
+                    ((url,) for url in history)
+                )
+                self.conn.executemany(
+                    "UPDATE pictures SET state = ? WHERE url = ?",
+                    ((SHOWN, url) for url in history)
+                )
+                self.append_pending(data.get("pictures", []), shuffle=False)
+            os.replace(path, path + ".yml.bak")
+        logger.info(_("Previous roadmap has been imported"))
+
+    def _next_index(self, count=1):
+        # Indexes are never reused, even after a picture removal, such that
+        # a batch never sees pictures which were not part of it.
+        row = self.conn.execute(
+            "SELECT value FROM settings WHERE key = 'next_index'").fetchone()
+        first = row[0] if row is not None else 1
+        self.conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) "
+            "VALUES ('next_index', ?)", (first + count,))
+        return first
+
+    def _source_id(self, name):
+        source_id = self._source_ids.get(name)
+        if source_id is None:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO sources (name) VALUES (?)", (name,))
+            source_id = self.conn.execute(
+                "SELECT id FROM sources WHERE name = ?", (name,)
+            ).fetchone()[0]
+            self._source_ids[name] = source_id
+        return source_id
+
+    def _source_name(self, source_id):
+        name = self._source_names.get(source_id)
+        if name is None:
+            for row_id, row_name in self.conn.execute(
+                    "SELECT id, name FROM sources"):
+                self._source_names[row_id] = sys.intern(row_name)
+            name = self._source_names[source_id]
+        return name
+
+    def _entry(self, row):
+        # Build the entry of the picture from its ENTRY_COLUMNS, and fetch
+        # its metadata.
+        url, source, path, pool = row
+        if pool is not None:
+            pool = self._source_name(pool)
+        entry = RoadmapEntry(url, self._source_name(source), path=path,
+                             pool=pool)
+        meta = self.conn.execute(
+            "SELECT page, rights, description, author FROM metadata "
+            "WHERE url = ?", (url,)).fetchone()
+        if meta is not None:
+            (entry.url, entry.copyright, entry.description,
+             entry.author) = meta
+        return entry
+
+    def _store_entry(self, entry):
+        pool = None
+        if entry.pool is not None:
+            pool = self._source_id(entry.pool)
+        self.conn.execute(
+            "INSERT INTO pictures (idx, url, state, source, path, pool) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+            "source = excluded.source, path = excluded.path, "
+            "pool = IFNULL(excluded.pool, pool)",
+            (self._next_index(), entry.image, WAITING,
+             self._source_id(entry.type), entry.path, pool)
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO metadata (url, page, rights, "
+            "description, author) VALUES (?, ?, ?, ?, ?)",
+            (entry.image, entry.url, entry.copyright, entry.description,
+             entry.author)
+        )
+
+    def store_pictures(self, pictures):
+        """Store the given pictures information.
+
+        pictures is a dictionary indexed by url, which values are either
+        RoadmapEntry objects or picture data as returned by the fetchers.
+        """
+        with self:
+            for url, data in pictures.items():
+                self._store_entry(RoadmapEntry.from_data(url, data))
+
+    def get(self, url):
+        row = self.conn.execute(
+            "SELECT {} FROM pictures WHERE url = ?".format(
+                ", ".join(ENTRY_COLUMNS)), (url,)).fetchone()
+        if row is None:
+            return None
+        return self._entry(row)
+
+    def contains(self, url):
+        return self.conn.execute(
+            "SELECT 1 FROM pictures WHERE url = ?", (url,)
+        ).fetchone() is not None
+
+    def pending_count(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM pictures WHERE state = ?", (PENDING,)
+        ).fetchone()[0]
+
+    def pending_count_by_pool(self):
+        """Return the number of pending pictures of each source."""
+        counts = {}
+        for pool, count in self.conn.execute(
+                "SELECT pool, COUNT(*) FROM pictures WHERE state = ? "
+                "GROUP BY pool", (PENDING,)):
+            if pool is not None:
+                pool = self._source_name(pool)
+            counts[pool] = count
+        return counts
+
+    def is_pending(self, url):
+        return self.conn.execute(
+            "SELECT 1 FROM pictures WHERE url = ? AND state = ?",
+            (url, PENDING)
+        ).fetchone() is not None
+
+    def pending_urls(self):
+        return {row[0] for row in self.conn.execute(
+            "SELECT url FROM pictures WHERE state = ?", (PENDING,))}
+
+    def known_urls(self):
+        return {row[0] for row in self.conn.execute(
+            "SELECT url FROM pictures")}
+
+    def _walk_batch(self, start, size, seed, cursor, columns=("url",)):
+        # Yield the cursor and the requested columns of the pending picture
+        # it points to, skipping pictures which have been removed,
+        # displayed or queued again somewhere else since the batch
+        # creation.
+        query = "SELECT {} FROM pictures WHERE idx = ? AND state = ?".format(
+            ", ".join(columns))
+        while cursor < size:
+            row = self.conn.execute(
+                query, (start + permute(cursor, size, seed), PENDING)
+            ).fetchone()
+            if row is not None:
+                yield cursor, row
+            cursor += 1
+
+    def _batches(self, pool=None, front=False):
+        if front:
+            return self.conn.execute(
+                "SELECT position, start, size, seed, cursor FROM batches "
+                "WHERE front = 1 ORDER BY position").fetchall()
+        return self.conn.execute(
+            "SELECT position, start, size, seed, cursor FROM batches "
+            "WHERE front = 0 AND pool IS ? ORDER BY position",
+            (pool,)).fetchall()
+
+    def _pool_weights(self):
+        # Return the weight of each pool having queued pictures
+        weights = {}
+        for (pool,) in self.conn.execute(
+                "SELECT DISTINCT pool FROM batches WHERE front = 0"):
+            name = pool if pool is None else self._source_name(pool)
+            weights[pool] = self.weights.get(name, 1)
+        return weights
+
+    def _draw_rng(self, offset=0):
+        # Return the random generator used for the next draw, which only
+        # depends on a seed and on the number of already shown pictures.
+        seed = self._get_setting("draw_seed") or 0
+        count = self._get_setting("draw_count") or 0
+        return random.Random((seed << 32) + count + offset)
+
+    def _head_of_batches(self, batches, skip):
+        # Return the first pending picture of the given batches, as a row of
+        # ENTRY_COLUMNS, or None if they only contain skipped pictures.
+        for position, start, size, seed, cursor in batches:
+            moved = False
+            for new_cursor, row in self._walk_batch(
+                    start, size, seed, cursor, ENTRY_COLUMNS):
+                if not moved and new_cursor != cursor:
+                    self.conn.execute(
+                        "UPDATE batches SET cursor = ? "
+                        "WHERE position = ?", (new_cursor, position))
+                moved = True
+                if row[0] in skip:
+                    continue
+                return row
+            if not moved:
+                # Exhausted batch
+                self.conn.execute(
+                    "DELETE FROM batches WHERE position = ?", (position,))
+        return None
+
+    def head(self, skip=()):
+        """Return the url and entry of the next pending picture, if any.
+
+        Pictures whose url is in skip are ignored, but left pending. Batch
+        cursors are moved past the pictures which are not pending anymore,
+        and exhausted batches are dropped.
+        """
+        with self:
+            # Pictures pushed at the front come first
+            row = self._head_of_batches(self._batches(front=True), skip)
+            if row is not None:
+                return row[0], self._entry(row)
+            weights = self._pool_weights()
+            rng = self._draw_rng()
+            while len(weights) != 0:
+                pool = weighted_choice(rng, weights)
+                row = self._head_of_batches(self._batches(pool), skip)
+                if row is not None:
+                    return row[0], self._entry(row)
+                del weights[pool]
+        return None, None
+
+    def _iter_batches(self, batches, columns=("url",)):
+        for batch in batches:
+            for _cursor, row in self._walk_batch(*batch[1:], columns):
+                yield row
+
+    def _pool_id(self, name):
+        row = self.conn.execute(
+            "SELECT id FROM sources WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def iter_pending(self, pool=None):
+        """Yield the pending urls, in the order they will be displayed.
+
+        When pool is given, only yield the pictures of this source.
+        """
+        if pool is not None:
+            pool_id = self._pool_id(pool)
+            if pool_id is None:
+                return
+            for url, url_pool in self._iter_batches(
+                    self._batches(front=True), ("url", "pool")):
+                if url_pool == pool_id:
+                    yield url
+            for (url,) in self._iter_batches(self._batches(pool_id)):
+                yield url
+            return
+        count = 0
+        for (url,) in self._iter_batches(self._batches(front=True)):
+            yield url
+            count += 1
+        # Replay the draws head will do
+        weights = self._pool_weights()
+        pools = {pool: self._iter_batches(self._batches(pool))
+                 for pool in weights}
+        while len(weights) != 0:
+            rng = self._draw_rng(count)
+            while len(weights) != 0:
+                pool = weighted_choice(rng, weights)
+                row = next(pools[pool], None)
+                if row is not None:
+                    yield row[0]
+                    count += 1
+                    break
+                del weights[pool]
+
+    def iter_history(self, offset=0, limit=-1, pool=None):
+        """Yield the urls of the displayed pictures, the oldest first.
+
+        When offset and limit are given, only yield the limit entries
+        before the offset last ones. When pool is given, only the pictures
+        of this source are considered.
+        """
+        if pool is None:
+            source = "history"
+            params = ()
+        else:
+            source = ("history JOIN pictures ON pictures.url = history.url "
+                      "AND pictures.pool = ?")
+            pool_id = self._pool_id(pool)
+            if pool_id is None:
+                return
+            params = (pool_id,)
+        if offset == 0 and limit < 0:
+            query = "SELECT history.url FROM {} ORDER BY position"
+        else:
+            query = ("SELECT url FROM (SELECT position, history.url AS url "
+                     "FROM {} ORDER BY position DESC LIMIT ? OFFSET ?) "
+                     "ORDER BY position")
+            params += (limit, offset)
+        for row in self.conn.execute(query.format(source), params):
+            yield row[0]
+
+    def history_count(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def last_shown(self, count=1):
+        return [row[0] for row in self.conn.execute(
+            "SELECT url FROM history ORDER BY position DESC LIMIT ?",
+            (count,))]
+
+    def _get_setting(self, key):
+        row = self.conn.execute(
+            "SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_setting(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (key, value))
+
+    def history_cursor(self):
+        """Return the history position of the current wallpaper."""
+        cursor = self._get_setting("history_cursor")
+        if cursor is not None:
+            return cursor
+        return self.conn.execute(
+            "SELECT IFNULL(MAX(position), 0) FROM history").fetchone()[0]
+
+    def set_history_cursor(self, position):
+        with self:
+            self._set_setting("history_cursor", position)
+
+    def history_neighbour(self, backward=True, skip=()):
+        """Return the picture displayed before or after the current one.
+
+        The result is a (position, url, entry) tuple, or (None, None, None)
+        when the history cursor is already at the corresponding end.
+        Pictures whose url is in skip are ignored.
+        """
+        columns = ", ".join("pictures." + c for c in ENTRY_COLUMNS)
+        if backward:
+            query = ("SELECT position, {} FROM history "
+                     "JOIN pictures ON pictures.url = history.url "
+                     "WHERE position < ? ORDER BY position DESC LIMIT 1")
+        else:
+            query = ("SELECT position, {} FROM history "
+                     "JOIN pictures ON pictures.url = history.url "
+                     "WHERE position > ? ORDER BY position LIMIT 1")
+        query = query.format(columns)
+        position = self.history_cursor()
+        while True:
+            row = self.conn.execute(query, (position,)).fetchone()
+            if row is None:
+                return None, None, None
+            position = row[0]
+            if row[1] not in skip:
+                return position, row[1], self._entry(row[1:])
+
+    def _queue(self, urls, front=False, shuffle=True):
+        # Group the pictures by pool, leaving already pending ones
+        pools = {}
+        for url in urls:
+            row = self.conn.execute(
+                "SELECT pool FROM pictures WHERE url = ? AND state != ?",
+                (url, PENDING)).fetchone()
+            if row is None:
+                continue
+            pools.setdefault(None if front else row[0], []).append(url)
+        if len(pools) != 0 and self._get_setting("draw_seed") is None:
+            self._set_setting("draw_seed", random.getrandbits(62))
+        for pool, pool_urls in pools.items():
+            first = self._next_index(len(pool_urls))
+            for pos, url in enumerate(pool_urls):
+                # Give the picture a new index, in the range of the new
+                # batch. Its former index, if any, is now unknown to every
+                # batch.
+                self.conn.execute(
+                    "UPDATE pictures SET idx = ?, state = ? WHERE url = ?",
+                    (first + pos, PENDING, url))
+            if front:
+                query = "SELECT IFNULL(MIN(position), 0) - 1 FROM batches"
+            else:
+                query = "SELECT IFNULL(MAX(position), 0) + 1 FROM batches"
+            position = self.conn.execute(query).fetchone()[0]
+            seed = random.getrandbits(63) if shuffle else None
+            self.conn.execute(
+                "INSERT INTO batches (position, start, size, seed, pool, "
+                "front) VALUES (?, ?, ?, ?, ?, ?)",
+                (position, first, len(pool_urls), seed, pool, int(front)))
+
+    def push_front(self, url):
+        with self:
+            self._queue([url], front=True)
+
+    def append_pending(self, urls, shuffle=True):
+        """Queue the given pictures, which must already be stored.
+
+        Unless shuffle is False, they will be displayed in a random order.
+        Pictures, which are already pending, are left untouched.
+        """
+        with self:
+            self._queue(urls, shuffle=shuffle)
+
+    def mark_shown(self, url, history_size=HISTORY_SIZE):
+        """Append url to the history and make it the current wallpaper.
+
+        Only the history_size last entries of the history are kept.
+        """
+        with self:
+            if self.is_pending(url):
+                self._set_setting(
+                    "draw_count", (self._get_setting("draw_count") or 0) + 1)
+            self.conn.execute(
+                "UPDATE pictures SET state = ? WHERE url = ?", (SHOWN, url))
+            position = self.conn.execute(
+                "INSERT INTO history (position, url) VALUES ("
+                "(SELECT IFNULL(MAX(position), 0) + 1 FROM history), ?)",
+                (url,)).lastrowid
+            self.conn.execute(
+                "DELETE FROM history WHERE position <= ?",
+                (position - history_size,))
+            self.set_history_cursor(position)
+
+    def remove(self, url):
+        """Forget everything about a picture and return its entry."""
+        with self:
+            entry = self.get(url)
+            self.conn.execute("DELETE FROM history WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM pictures WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM metadata WHERE url = ?", (url,))
+        return entry
+
+    def prune(self):
+        """Forget pictures, which are neither pending nor in history."""
+        with self:
+            self.conn.execute(
+                "DELETE FROM pictures WHERE state != ? AND url NOT IN "
+                "(SELECT url FROM history)", (PENDING,)
+            )
+            self.conn.execute(
+                "DELETE FROM metadata WHERE url NOT IN "
+                "(SELECT url FROM pictures)"
+            )
+
+    def reset(self):
+        """Empty the pending list, but keep the history."""
+        with self:
+            self.conn.execute("DELETE FROM batches")
+            self.conn.execute(
+                "UPDATE pictures SET state = ? WHERE state = ?",
+                (WAITING, PENDING))
+            self.prune()
+
+
+# This function may be called from a gui app and pass a widget or other stuff
+# as arguments
+def reset_pending_list(*opts):
+    road_map = Roadmap()
+    road_map.reset()
+    road_map.close()
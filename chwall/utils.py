@@ -1,8 +1,10 @@
 import os
 import re
 import yaml
+import fcntl
 import hashlib
 import logging
+import threading
 import subprocess
 from xdg.BaseDirectory import xdg_cache_home, xdg_config_home
 
@@ -77,6 +79,15 @@ def read_config():
     config["general"].setdefault("sources", ["bing", "natgeo"])
     config["general"].setdefault("sleep", 10 * 60)
     config["general"].setdefault("notify", False)
+    config["general"].setdefault("refill_threshold", 5)
+    config["general"].setdefault("history_size", 500)
+    config["general"].setdefault("source_weights", {})
+    config["general"].setdefault("pool_size", 200)
+    config["general"].setdefault("max_download_size", 100)
+    config["general"].setdefault("download_segments", 1)
+    config["general"].setdefault("prefetch_count", 3)
+    config["general"].setdefault("prefetch_budget", 200)
+    config["general"].setdefault("cache_size", 1000)
     config["general"].setdefault(
         "favorites_path", "{}/favorites".format(BASE_CACHE_PATH)
     )
@@ -90,61 +101,64 @@ def write_config(config):
                           explicit_start=True))
 
 
-# This function may be called from a gui app and pass a widget or other stuff
-# as arguments
-def reset_pending_list(*opts):
-    road_map = "{}/roadmap".format(BASE_CACHE_PATH)
-    if os.path.exists(road_map):
-        os.unlink(road_map)
+class RoadmapLock:
+    """Exclusive and reentrant lock on the roadmap.
 
+    It protects the roadmap from concurrent modifications coming from other
+    threads of the same process (like a background refill) as well as from
+    other chwall processes (daemon, client or gui).
+    """
 
-def compute_cache_size():
-    pic_cache = "{}/pictures".format(BASE_CACHE_PATH)
-    if not os.path.exists(pic_cache):
-        return 0
-    cache_total = 0
-    for pic in os.scandir(pic_cache):
-        cache_total += pic.stat().st_size
-    cache_total = cache_total / 1000
-    if cache_total > 1000000:
-        return "{} Go".format(str(round(cache_total/1000000, 2)))
-    elif cache_total > 1000:
-        return "{} Mo".format(str(round(cache_total/1000, 2)))
-    return "{} ko".format(str(round(cache_total, 2)))
-
-
-def is_broken_picture(picture):
-    common_sums = [
-        # reddit broken picture
-        "35a0932c61e09a8c1cad9eec75b67a03602056463ed210310d2a09cf0b002ed5"
-    ]
-    check = hashlib.sha256()
-    with open(picture, "rb") as f:
-        check.update(f.read())
-    return check.hexdigest() in common_sums
+    def __init__(self):
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
 
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            self._lock_file = open(
+                "{}/roadmap.lock".format(BASE_CACHE_PATH), "w")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
 
-def count_broken_pictures_in_cache():
-    pic_cache = "{}/pictures".format(BASE_CACHE_PATH)
-    if not os.path.exists(pic_cache):
-        return 0
-    broken_files = 0
-    for pic in os.scandir(pic_cache):
-        if pic.stat().st_size == 0 or is_broken_picture(pic):
-            broken_files += 1
-    return broken_files
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        self._thread_lock.release()
 
 
-def cleanup_cache(clear_all=False):
-    pic_cache = "{}/pictures".format(BASE_CACHE_PATH)
-    if not os.path.exists(pic_cache):
-        return 0
-    deleted = 0
-    for pic in os.scandir(pic_cache):
-        if clear_all or pic.stat().st_size == 0 or is_broken_picture(pic):
-            os.unlink(pic.path)
-            deleted += 1
-    return deleted
+roadmap_lock = RoadmapLock()
+
+
+BROKEN_PICTURE_SUMS = [
+    # reddit broken picture
+    "35a0932c61e09a8c1cad9eec75b67a03602056463ed210310d2a09cf0b002ed5"
+]
+
+
+def file_checksum(path):
+    """Return the hexadecimal SHA-256 sum of a file, read by chunks."""
+    check = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            check.update(chunk)
+    return check.hexdigest()
+
+
+def is_broken_picture(picture, checksum=None):
+    """Tell if picture is a known placeholder for a missing picture.
+
+    checksum is the hexadecimal SHA-256 sum of the picture, if already
+    known. Otherwise, it is computed from the picture file.
+    """
+    if checksum is None:
+        checksum = file_checksum(picture)
+    return checksum in BROKEN_PICTURE_SUMS
 
 
 def get_logger(name):
@@ -1,17 +1,25 @@
 import os
 import time
-import yaml
+import itertools
 import random
 import shutil
-import hashlib
-import requests
+import threading
 import subprocess
 from PIL import Image, ImageFilter
-from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # chwall imports
 from chwall.utils import BASE_CACHE_PATH, get_screen_config, get_wall_config, \
-                         get_logger, is_broken_picture
+                         get_logger, is_broken_picture, roadmap_lock
+from chwall.network import MAX_DOWNLOAD_SIZE, RETRY_ATTEMPTS, RETRY_ERRORS, \
+                           DownloadFailed, DownloadLock, DownloadTooLarge, \
+                           download, with_retry
+from chwall.roadmap import Roadmap, RoadmapEntry
+from chwall.cache import PictureCache
+from chwall.blacklist import file_fingerprint, read_blacklist
+from chwall.fetcher import fetcher_names, load_fetcher
+from chwall.health import read_sources_health, record_source_result, \
+                          source_state, write_sources_health
 
 import gettext
 # Uncomment the following line during development.
@@ -27,83 +35,383 @@ class ChwallWallpaperSetError(Exception):
     pass
 
 
-WAIT_ERROR = 10
+FETCH_TIMEOUT = 120
 
 
-def build_wallpapers_list(config):
+def iter_source_pictures(fetcher, config):
+    """Yield (url, picture data) tuples from the given fetcher module.
+
+    Fetchers may provide an ``iter_pictures`` generator, which yields
+    pictures as soon as they are known. Otherwise, their ``fetch_pictures``
+    function is used, which returns all of them at once.
+    """
+    if hasattr(fetcher, "iter_pictures"):
+        yield from fetcher.iter_pictures(config)
+    else:
+        yield from fetcher.fetch_pictures(config).items()
+
+
+class PictureSample:
+    """Random sample of the pictures of a source, built while fetching them.
+
+    Pictures never met before (not in known) are kept apart from the known
+    ones, which are only used when the source has nothing new. Those in
+    excluded, or blacklisted, are ignored. Each set keeps at most size
+    pictures, uniformly chosen among all those met (reservoir sampling).
+    Thus a huge source, like a large local folder, is never fully kept in
+    memory. With a size of None, all pictures are kept.
+    """
+
+    def __init__(self, size=None, known=(), excluded=(), blacklist=None):
+        self.size = size
+        self.known = known
+        self.excluded = excluded
+        self.blacklist = blacklist
+        self.unseen = []
+        self.recycled = []
+        self._met = [0, 0]
+
+    def add(self, url, entry):
+        if self.blacklist is not None and url in self.blacklist:
+            logger.warning(
+                _("Remove {picture} as it's in blacklist").format(picture=url)
+            )
+            return
+        if url in self.excluded:
+            return
+        is_known = url in self.known
+        reservoir = self.recycled if is_known else self.unseen
+        self._met[is_known] += 1
+        if self.size is None or len(reservoir) < self.size:
+            reservoir.append((url, entry))
+            return
+        slot = random.randrange(self._met[is_known])
+        if slot < self.size:
+            reservoir[slot] = (url, entry)
+
+    def pictures(self):
+        """Return the new pictures, or the known ones if none is new."""
+        return dict(self.unseen or self.recycled)
+
+
+def fetch_source_pictures(module_name, config, deadline,
+                          attempts=RETRY_ATTEMPTS, on_picture=None,
+                          new_sample=PictureSample):
+    """Return the pictures of one source and whether it succeeded.
+
+    Pictures are gathered in a PictureSample, as returned by new_sample.
+
+    If given, on_picture is called from the fetching thread for each picture
+    as soon as it is known.
+    """
+    logger.info(
+        _("Fetching pictures list from {name}").format(name=module_name)
+    )
+
+    def _fetch_pictures():
+        # Start again from scratch on each attempt
+        sample = new_sample()
+        m = load_fetcher(module_name)
+        for url, data in iter_source_pictures(m, config):
+            entry = RoadmapEntry.from_data(url, data, module_name)
+            sample.add(url, entry)
+            if on_picture is not None:
+                on_picture(url, entry)
+        return sample
+
+    try:
+        return with_retry(_fetch_pictures, module_name,
+                          deadline, attempts), True
+    except RETRY_ERRORS as e:
+        logger.error(
+            _("Catch {error} exception while retrieving "
+              "images from {module}. Giving up.")
+            .format(error=type(e).__name__, module=module_name)
+        )
+    except Exception as e:
+        logger.error(
+            "{} in {}: {}".format(type(e).__name__, module_name, e)
+        )
+    return new_sample(), False
+
+
+def build_wallpapers_list(config, on_picture=None, sources=None,
+                          new_sample=PictureSample):
+    """Fetch the pictures of the given sources, all at once.
+
+    Return a dictionary of PictureSample, as returned by new_sample,
+    indexed by source name.
+    """
     logger.info(_("Fetching pictures addresses…"))
     collecs = {}
-    for module_name in config["general"]["sources"]:
-        try_again = 5
-        ll = {}
-        m = import_module("chwall.fetcher.{}".format(module_name))
-
-        while try_again > 0:
-            logger.info(
-                _("Fetching pictures list from {name} - Attempt {number}")
-                .format(name=module_name, number=(6 - try_again))
+    if sources is None:
+        sources = config["general"]["sources"]
+    if len(sources) == 0:
+        return collecs
+    # Fetchers modules are only imported when they are actually used
+    known_sources = fetcher_names()
+    health = read_sources_health()
+    now = time.time()
+    attempts = {}
+    for module_name in sources:
+        if module_name not in known_sources:
+            logger.error(
+                _("Unknown pictures source {module}. Skipping it.")
+                .format(module=module_name)
             )
-            try:
-                ll = m.fetch_pictures(config)
-                try_again = 0
-            except (requests.exceptions.ConnectionError,
-                    requests.exceptions.HTTPError,
-                    requests.exceptions.Timeout) as e:
-                logger.error(
-                    _("Catch {error} exception while retrieving "
-                      "images from {module}. Wait {time} seconds "
-                      "before retrying.")
-                    .format(
-                        error=type(e).__name__, module=module_name,
-                        time=WAIT_ERROR
-                    )
-                )
-
-                try_again -= 1
-                try:
-                    time.sleep(WAIT_ERROR)
-                except KeyboardInterrupt:
-                    logger.warning(_("Retry NOW to connect to {module}")
-                                   .format(module=module_name))
-            except KeyboardInterrupt:
-                logger.warning(_("Switch to next picture provider or exit"))
-                try_again = 0
-            except Exception as e:
+            continue
+        state = source_state(health.get(module_name), now)
+        if state == "open":
+            logger.warning(
+                _("{module} failed too many times recently. Skipping it.")
+                .format(module=module_name)
+            )
+            continue
+        # A source coming back from failure is probed only once
+        attempts[module_name] = 1 if state == "half-open" else RETRY_ATTEMPTS
+    if len(attempts) == 0:
+        return collecs
+    default_timeout = config["general"].get("fetch_timeout", FETCH_TIMEOUT)
+    started_at = time.monotonic()
+    # Each source runs in its own thread, thus a slow or unreachable one
+    # does not delay the others.
+    executor = ThreadPoolExecutor(max_workers=len(attempts),
+                                  thread_name_prefix="chwall-fetcher")
+    pending = {}
+    for module_name, max_attempts in attempts.items():
+        timeout = config.get(module_name, {}).get("timeout", default_timeout)
+        deadline = started_at + timeout
+        future = executor.submit(fetch_source_pictures, module_name,
+                                 config, deadline, max_attempts, on_picture,
+                                 new_sample)
+        pending[future] = (module_name, deadline)
+    try:
+        while len(pending) > 0:
+            next_deadline = min(d for _m, d in pending.values())
+            done, _not_done = wait(
+                pending.keys(),
+                timeout=max(0, next_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                module_name = pending.pop(future)[0]
+                sample, success = future.result()
+                record_source_result(health, module_name, success)
+                collecs[module_name] = sample
+            now = time.monotonic()
+            for future, (module_name, deadline) in list(pending.items()):
+                if deadline > now:
+                    continue
                 logger.error(
-                    "{} in {}: {}".format(type(e).__name__, module_name, e)
+                    _("{module} did not answer in time. Skipping it.")
+                    .format(module=module_name)
                 )
-                break
-        collecs.update(ll)
+                future.cancel()
+                pending.pop(future)
+                record_source_result(health, module_name, False)
+    except KeyboardInterrupt:
+        logger.warning(_("Stop waiting for remaining picture providers"))
+    finally:
+        # Do not wait for late sources, their results will be ignored.
+        executor.shutdown(wait=False)
+        write_sources_health(health)
     return collecs
 
 
-def filter_wallpapers_list(collecs):
-    all_pics = list(collecs.keys())
-    try:
-        with open("{}/blacklist.yml"
-                  .format(BASE_CACHE_PATH), "r") as f:
-            blacklist = yaml.safe_load(f) or []
-    except FileNotFoundError:
-        blacklist = []
-    all_pics_copy = all_pics.copy()
-    for p in all_pics_copy:
-        if p not in blacklist:
-            continue
-        logger.warning(
-            _("Remove {picture} as it's in blacklist").format(picture=p)
-        )
-        all_pics.remove(p)
-        collecs.pop(p)
-    return (all_pics, collecs)
+class RoadmapFiller(threading.Thread):
+    """Background refill of the roadmap, which can serve pictures early.
+
+    It runs refill_roadmap for the given sources, or all of them if None.
+    Meanwhile, each call to wait_for_picture pushes the next fetched
+    picture, never met before, to the front of the pending list, such that
+    it can be displayed without waiting for every source to answer.
+    """
+
+    def __init__(self, config, sources=None):
+        super().__init__(name="chwall-roadmap-filler", daemon=True)
+        self.config = config
+        self.sources = sources
+        self._cond = threading.Condition()
+        self._wanted = False
+        self._served = 0
+        self._done = False
+        self._known = set()
+        self._blacklist = ()
+
+    def run(self):
+        try:
+            road_map = Roadmap()
+            try:
+                self._known = road_map.known_urls()
+            finally:
+                road_map.close()
+            self._blacklist = read_blacklist()
+            refill_roadmap(self.config, self._on_picture, self.sources)
+        except Exception as e:
+            logger.error("{}: {}".format(type(e).__name__, e))
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _on_picture(self, url, entry):
+        # Already shown pictures are left to refill_roadmap, which will only
+        # add them again if there is nothing new.
+        if url in self._known or url in self._blacklist:
+            return
+        with self._cond:
+            if not self._wanted:
+                return
+            road_map = Roadmap()
+            try:
+                with roadmap_lock, road_map:
+                    if road_map.contains(url):
+                        return
+                    road_map.store_pictures({url: entry})
+                    road_map.push_front(url)
+            finally:
+                road_map.close()
+            self._known.add(url)
+            self._wanted = False
+            self._served += 1
+            self._cond.notify_all()
+
+    @property
+    def done(self):
+        return self._done
+
+    def wait_for_picture(self):
+        """Wait for a new picture at the front of the pending list.
+
+        Return True once it is there, or False if the filler ended without
+        any new picture to serve. All the pictures it accepted are then in
+        the roadmap.
+        """
+        with self._cond:
+            served = self._served
+            self._wanted = True
+            self._cond.wait_for(
+                lambda: self._done or self._served > served)
+            return self._served > served
+
+
+_filler = None
+_filler_lock = threading.Lock()
+
+
+def start_roadmap_filler(config, sources=None):
+    """Return the running RoadmapFiller, or start a new one.
+
+    There is at most one filler per process, thus sources are never fetched
+    twice at once.
+    """
+    global _filler
+    with _filler_lock:
+        if _filler is None or _filler.done:
+            _filler = RoadmapFiller(config, sources)
+            _filler.start()
+        return _filler
 
 
 def build_roadmap(config):
-    data = filter_wallpapers_list(build_wallpapers_list(config))
-    all_pics = data[0]
-    random.shuffle(all_pics)
-    road_map = {"data": data[1], "pictures": all_pics, "history": []}
-    with open("{}/roadmap".format(BASE_CACHE_PATH), "w") as f:
-        yaml.dump(road_map, f, explicit_start=True, default_flow_style=False)
+    """Fill the empty pending list.
+
+    Return as soon as a first new picture is known, such that it can be
+    downloaded and displayed right away. The other pictures are appended to
+    the roadmap in background, when every source has answered. If no new
+    picture is found before that, return once they are appended.
+
+    The roadmap must not be locked by the caller, as the background filler
+    would never be able to append them.
+    """
+    filler = start_roadmap_filler(config)
+    if filler.wait_for_picture() or filler.sources is None:
+        return
+    # The running filler only fetched some sources, try all of them
+    start_roadmap_filler(config).wait_for_picture()
+
+
+# Sources, which last refill did not add any picture. They are only
+# fetched again with all the others, such that a misconfigured or failing
+# source is not fetched again on each daemon step.
+_exhausted_sources = set()
+
+
+def sources_to_refill(config):
+    """Return the sources, which pending pictures must be fetched again.
+
+    All of them are returned when fewer than general.refill_threshold
+    pictures remain pending. Otherwise, only those without any pending
+    picture left are, unless their last refill did not add any picture.
+    """
+    road_map = Roadmap()
+    counts = road_map.pending_count_by_pool()
+    road_map.close()
+    sources = config["general"]["sources"]
+    if sum(counts.values()) < config["general"]["refill_threshold"]:
+        return list(sources)
+    return [s for s in sources if counts.get(s, 0) == 0
+            and s not in _exhausted_sources]
+
+
+def refill_roadmap(config, on_picture=None, sources=None):
+    """Append freshly fetched pictures to the current roadmap.
+
+    Only the given sources are fetched, or all the configured ones if None.
+    Pictures already pending are not added twice and the history is kept
+    untouched. Each source is handled on its own: pictures never shown are
+    preferred, and already shown ones are only added again when the source
+    has no new one, to start a new cycle. At most general.pool_size pictures
+    of each source are added at once, randomly chosen while they are
+    fetched.
+    Return the number of pictures added.
+    """
+    road_map = Roadmap()
+    with roadmap_lock, road_map:
+        # Forget about pictures, which are neither pending nor in history
+        # anymore.
+        road_map.prune()
+        known = road_map.known_urls()
+        # Do not show pending pictures twice, nor the current wallpaper
+        # again right away.
+        excluded = road_map.pending_urls()
+        excluded.update(road_map.last_shown())
+    blacklist = read_blacklist()
+    pool_size = config["general"]["pool_size"]
+    collecs = build_wallpapers_list(
+        config, on_picture, sources,
+        lambda: PictureSample(pool_size, known, excluded, blacklist))
+    new_pics = {}
+    with roadmap_lock, road_map:
+        for module_name in sources or config["general"]["sources"]:
+            sample = collecs.get(module_name)
+            if sample is None:
+                # Unknown or skipped source
+                _exhausted_sources.add(module_name)
+                continue
+            # Roadmap may have changed while fetching pictures
+            pictures = {p: e for p, e in sample.pictures().items()
+                        if not road_map.is_pending(p)}
+            if len(sample.unseen) > 0:
+                pictures = {p: e for p, e in pictures.items()
+                            if not road_map.contains(p)}
+            if len(pictures) == 0:
+                _exhausted_sources.add(module_name)
+            else:
+                _exhausted_sources.discard(module_name)
+            new_pics.update(pictures)
+        road_map.store_pictures(new_pics)
+        # The order of the new pictures is shuffled by the roadmap itself
+        road_map.append_pending(new_pics)
+    road_map.close()
+    logger.info(
+        gettext.ngettext(
+            "{number} picture added to the pending list.",
+            "{number} pictures added to the pending list.",
+            len(new_pics)
+        ).format(number=len(new_pics))
+    )
+    return len(new_pics)
 
 
 def set_xfce_wallpaper(path):
@@ -261,160 +569,336 @@ def set_wallpaper(path, config):
     return path
 
 
-def fetch_wallpaper(wp_data):
-    current_wall = clean_wallpaper_info(wp_data)
-    pic_file = current_wall[4]
-
-    def _write_current_wallpaper_info(current_wall):
-        with open("{}/current_wallpaper".format(BASE_CACHE_PATH), "w") as f:
-            for line in current_wall:
-                f.write(line + "\n")
+def download_picture(entry, blacklist=None, max_size=MAX_DOWNLOAD_SIZE,
+                     segments=1):
+    """Download the picture of entry in cache if needed and return its path.
 
+    Return None when the picture cannot be downloaded right now, "next"
+    when it must be blacklisted and "skip" when it must only be forgotten.
+    It is then up to the caller to do so.
+    """
+    pic_file = entry.path
     if os.path.exists(pic_file):
-        _write_current_wallpaper_info(current_wall)
-        return pic_file, current_wall[0]
+        return pic_file
+    if entry.type == "local":
+        # The local picture has been removed since
+        return "skip"
+
+    # The prefetcher or another process may be downloading it right now
+    with DownloadLock(pic_file) as part_file:
+        if os.path.exists(pic_file):
+            return pic_file
+        return _download_picture(entry, part_file, blacklist, max_size,
+                                 segments)
+
+
+def _download_picture(entry, part_file, blacklist, max_size, segments):
+    pic_file = entry.path
+    url = entry.image
+    # Download in a partial file first, such that an interrupted download
+    # never looks like a cached picture. Each attempt resumes from the
+    # bytes received by the previous ones.
+    try:
+        checksum, size = with_retry(
+            lambda: download(url, part_file, max_size, segments), url)
+    except DownloadTooLarge:
+        logger.warning(
+            _("Remove {picture} as it is too large").format(picture=url)
+        )
+        return "skip"
+    except DownloadFailed as e:
+        logger.warning(
+            _("Remove {picture} as it cannot be downloaded: {error}")
+            .format(picture=url, error=e)
+        )
+        return "skip"
+    except RETRY_ERRORS as e:
+        # Do nothing yet and move back without anything.
+        logger.error(
+            _("Catch {error} exception while downloading {picture}. "
+              "Giving up.")
+            .format(error=type(e).__name__, picture=url)
+        )
+        return None
 
-    try_again = 5
-    while try_again > 0:
-        try:
-            pic_data = requests.get(current_wall[0]).content
-            with open(pic_file, "wb") as f:
-                f.write(pic_data)
-            break
-        except (requests.exceptions.ConnectionError,
-                requests.exceptions.HTTPError,
-                requests.exceptions.Timeout) as e:
-            logger.error(
-                _("Catch {error} exception while downloading {picture}. "
-                  "Wait {time} seconds before retrying.")
-                .format(error=type(e).__name__, picture=current_wall[0],
-                        time=WAIT_ERROR)
-            )
-            try_again -= 1
-            try:
-                time.sleep(WAIT_ERROR)
-            except KeyboardInterrupt:
-                logger.warning(_("Retry NOW to download {picture}")
-                               .format(picture=current_wall[0]))
-
-    if not os.path.exists(pic_file):
-        # We probably went here because of a network error. Thus do nothing yet
-        # and move back without anything.
-        return None, None
-    if os.path.getsize(pic_file) == 0:
+    if size == 0:
         # Do not keep empty files. It may be caused by a network error or
         # something else, which may be resolved later.
-        os.unlink(pic_file)
-        return None, None
+        return None
 
     # Now check file with common placeholder, like broken image on reddit
-    if is_broken_picture(pic_file):
-        # Remove useless picture
-        os.unlink(pic_file)
-        # Blacklist it
-        _write_current_wallpaper_info(current_wall)
-        blacklist_wallpaper()
-        # Pick next
-        return "next", None
+    if is_broken_picture(part_file, checksum):
+        # Remove useless picture and pick next
+        os.unlink(part_file)
+        return "next"
+
+    if blacklist is None:
+        blacklist = read_blacklist()
+    sha, dhash = file_fingerprint(part_file, checksum)
+    if blacklist.matches_checksum(sha):
+        # Same picture as a blacklisted one, but under another url
+        logger.warning(
+            _("Remove {picture} as it's in blacklist").format(picture=url)
+        )
+        os.unlink(part_file)
+        return "next"
+    if blacklist.resembles(dhash):
+        logger.warning(
+            _("Remove {picture} as it looks like a blacklisted one")
+            .format(picture=url)
+        )
+        os.unlink(part_file)
+        return "skip"
+
+    os.replace(part_file, pic_file)
+    cache = PictureCache()
+    try:
+        cache.add(pic_file, checksum)
+    finally:
+        cache.close()
+    return pic_file
+
+
+def fetch_wallpaper(entry, blacklist=None, max_size=MAX_DOWNLOAD_SIZE,
+                    segments=1):
+    """Download the picture of entry if needed and return its path and url.
+
+    Return (None, None) when the picture cannot be downloaded right now,
+    ("next", None) when it must be blacklisted and ("skip", None) when it
+    must only be forgotten. It is then up to the caller to do so, and to try
+    the next picture.
+    """
+    pic_file = download_picture(entry, blacklist, max_size, segments)
+    if pic_file in [None, "next", "skip"]:
+        return pic_file, None
+    current_wall = clean_wallpaper_info(entry)
+    with open("{}/current_wallpaper".format(BASE_CACHE_PATH), "w") as f:
+        for line in current_wall:
+            f.write(line + "\n")
+    return pic_file, entry.image
+
+
+def prefetch_wallpapers(config):
+    """Download the next pending pictures before they are displayed.
+
+    At most general.prefetch_count pictures are kept in cache ahead of
+    time, as long as they fit in general.prefetch_budget megabytes. The
+    next wallpaper change is then a mere cache hit, even on a slow or
+    temporarily broken network. Return the number of downloaded pictures.
+    """
+    count = config["general"]["prefetch_count"]
+    budget = config["general"]["prefetch_budget"] * 1024 * 1024
+    max_size = config["general"]["max_download_size"] * 1024 * 1024
+    segments = config["general"]["download_segments"]
+    if count <= 0 or budget <= 0:
+        return 0
+    with roadmap_lock:
+        road_map = Roadmap(config["general"]["source_weights"])
+        try:
+            entries = [road_map.get(url) for url in
+                       itertools.islice(road_map.iter_pending(), count)]
+        finally:
+            road_map.close()
+    blacklist = read_blacklist()
+    rejected = {}
+    used = 0
+    downloaded = 0
+    # The roadmap is not locked while downloading, such that the daemon may
+    # still pick a wallpaper in the meantime.
+    for entry in entries:
+        if entry is None or entry.type == "local":
+            continue
+        if used >= budget:
+            break
+        if os.path.exists(entry.path):
+            used += os.path.getsize(entry.path)
+            continue
+        pic_file = download_picture(entry, blacklist, max_size, segments)
+        if pic_file is None:
+            # Network is probably down, try again at the next change
+            break
+        if pic_file in ["next", "skip"]:
+            rejected[entry.image] = (entry, pic_file == "next")
+            continue
+        used += os.path.getsize(pic_file)
+        downloaded += 1
+    if len(rejected) > 0 or downloaded > 0:
+        with roadmap_lock:
+            road_map = Roadmap(config["general"]["source_weights"])
+            try:
+                _forget_rejected_pictures(road_map, blacklist, rejected)
+                enforce_cache_budget(config, road_map)
+            finally:
+                road_map.close()
+    return downloaded
 
-    _write_current_wallpaper_info(current_wall)
-    return pic_file, current_wall[0]
+
+def enforce_cache_budget(config, road_map):
+    """Remove least recently used pictures when the cache is too big.
+
+    The cache must fit in general.cache_size megabytes. The current
+    wallpaper and the pictures prefetched for the next changes are never
+    removed. road_map must be locked by the caller. Return the number of
+    removed pictures.
+    """
+    budget = config["general"]["cache_size"] * 1024 * 1024
+    if budget <= 0:
+        return 0
+    cache = PictureCache()
+    try:
+        if cache.total_size() <= budget:
+            return 0
+        protected = {current_wallpaper_info()["local-picture-path"]}
+        next_urls = itertools.islice(road_map.iter_pending(),
+                                     config["general"]["prefetch_count"])
+        for url in list(next_urls):
+            entry = road_map.get(url)
+            if entry is not None:
+                protected.add(entry.path)
+        return cache.evict(budget, protected)
+    finally:
+        cache.close()
 
 
 def pick_wallpaper(config, backward=False, guard=False):
-    road_map = "{}/roadmap".format(BASE_CACHE_PATH)
-    if not os.path.exists(road_map):
-        build_roadmap(config)
-    with open(road_map, "r") as f:
-        data = yaml.safe_load(f)
-    no_pic_left = len(data.get("pictures", [])) == 0 and backward is False
-    if no_pic_left or data is None:
-        # Woops, no picture left. Removing current roadmap.
-        os.unlink(road_map)
-        if guard is True:
-            # Wow, we already try to reload once, it's very bad to be
-            # there. Maybe a little network error. Be patient
-            logger.error(
-                _("Impossible to build a new road map. It may be "
-                  "caused by a temporarily network error. Please "
-                  "try again later.")
-            )
-            return None
-        # List is empty. Maybe it was the last picture of the current list?
-        # Thus, try again now. Backward is always false because at this point,
-        # something went wrong and we should start over.
-        return pick_wallpaper(config, False, True)
-    if backward is True:
-        # Current wallpaper is the last of the history array. Thus we should go
-        # back two times
-        if len(data.get("history", [])) >= 2:
-            # Current wall
-            data["pictures"].insert(0, data["history"].pop())
-            # Previous one
-            data["pictures"].insert(0, data["history"].pop())
-            # Now we are good to do a fake "forward" move
-    lp, wp = fetch_wallpaper(data["data"][data["pictures"][0]])
-    if lp is None:
-        # Something goes wrong, thus do nothing. It may be because of a
-        # networking error or something else.
-        logger.error(
-            _("Impossible to get any picture at this time. It may be "
-              "caused by a temporarily network error. Please try again "
-              "later.")
-        )
-        return None
-    if lp == "next":
-        # fetch_wallpaper already clean up thing, thus only return a new
-        # pick_wallpaper call.
-        return pick_wallpaper(config, backward)
-    data["pictures"].remove(wp)
-    data["history"].append(wp)
-    with open(road_map, "w") as f:
-        yaml.dump(data, f, explicit_start=True,
-                  default_flow_style=False)
+    road_map = Roadmap(config["general"]["source_weights"])
+    try:
+        return _pick_wallpaper(road_map, config, backward, guard)
+    finally:
+        road_map.close()
+
+
+def _pick_wallpaper(road_map, config, backward=False, guard=False):
+    blacklist = read_blacklist()
+    max_size = config["general"]["max_download_size"] * 1024 * 1024
+    segments = config["general"]["download_segments"]
+    # Bad candidates met on the way. They are only skipped in memory, and
+    # forgotten all at once by _forget_rejected_pictures.
+    rejected = {}
+    # The roadmap is only locked while reading or changing it, never during
+    # downloads. Thus a slow network does not block the background refill
+    # nor the prefetcher.
+    try:
+        while True:
+            with roadmap_lock:
+                # When the user went back in history, "next" moves forward
+                # in it before using pending pictures again.
+                position, wp, entry = road_map.history_neighbour(
+                    backward, rejected)
+                if wp is None and backward is False:
+                    wp, entry = road_map.head(rejected)
+            if wp is None and backward is True:
+                # Nothing older in history
+                return None
+            if wp is None:
+                if guard is True:
+                    # Wow, we already try to reload once, it's very bad to
+                    # be there. Maybe a little network error. Be patient
+                    logger.error(
+                        _("Impossible to build a new road map. It may be "
+                          "caused by a temporarily network error. Please "
+                          "try again later.")
+                    )
+                    return None
+                # List is empty. Maybe it was the last picture of the
+                # current list? Thus, fetch a new one, without losing
+                # history, and try again now.
+                _forget_rejected_pictures(road_map, blacklist, rejected)
+                build_roadmap(config)
+                guard = True
+                continue
+            lp, wp = fetch_wallpaper(entry, blacklist, max_size, segments)
+            if lp is None:
+                # Something goes wrong, thus do nothing. It may be because
+                # of a networking error or something else.
+                logger.error(
+                    _("Impossible to get any picture at this time. It may "
+                      "be caused by a temporarily network error. Please "
+                      "try again later.")
+                )
+                return None
+            if lp in ["next", "skip"]:
+                rejected[entry.image] = (entry, lp == "next")
+                continue
+            try:
+                lp = set_wallpaper(lp, config)
+            except OSError as e:
+                logger.error("{}: {}".format(type(e).__name__, e))
+                # Try again for next wallpaper
+                rejected[wp] = (entry, False)
+                continue
+            with roadmap_lock, road_map:
+                _forget_rejected_pictures(road_map, blacklist, rejected)
+                if position is None:
+                    road_map.mark_shown(wp, config["general"]["history_size"])
+                else:
+                    road_map.set_history_cursor(position)
+                _touch_cached_picture(entry)
+                enforce_cache_budget(config, road_map)
+            return lp
+    finally:
+        _forget_rejected_pictures(road_map, blacklist, rejected)
+
+
+def _forget_rejected_pictures(road_map, blacklist, rejected):
+    """Remove rejected pictures from the roadmap in one transaction.
+
+    rejected is a dictionary indexed by url, which values are (entry,
+    blacklisted) tuples. It is emptied afterward.
+    """
+    if len(rejected) == 0:
+        return
+    blacklist.add([url for url, (_entry, black) in rejected.items()
+                   if black])
+    with roadmap_lock, road_map:
+        for url in rejected:
+            road_map.remove(url)
+    for entry, _black in rejected.values():
+        _remove_cached_picture(entry)
+    rejected.clear()
+
+
+def _touch_cached_picture(entry):
+    if entry.type == "local":
+        return
+    cache = PictureCache()
     try:
-        lp = set_wallpaper(lp, config)
-    except OSError as e:
-        logger.error("{}: {}".format(type(e).__name__, e))
-        remove_wallpaper_from_roadmap(wp)
-        # Try again for next wallpaper
-        return pick_wallpaper(config, backward)
-    return lp
+        cache.touch(entry.path)
+    finally:
+        cache.close()
+
+
+def _remove_cached_picture(entry):
+    if entry.type == "local":
+        return
+    if os.path.exists(entry.path):
+        os.unlink(entry.path)
+    cache = PictureCache()
+    try:
+        cache.forget(entry.path)
+    finally:
+        cache.close()
 
 
 def remove_wallpaper_from_roadmap(wp):
-    road_map = "{}/roadmap".format(BASE_CACHE_PATH)
-    with open(road_map, "r") as f:
-        data = yaml.safe_load(f)
-    if wp in data.get("pictures", []):
-        data["pictures"].remove(wp)
-    if wp in data.get("history", []):
-        data["history"].remove(wp)
-    if wp in data.get("data", {}):
-        wallinfo = clean_wallpaper_info(data["data"][wp])
-        if wallinfo[3] != "local" and os.path.exists(wallinfo[4]):
-            os.unlink(wallinfo[4])
-        del data["data"][wp]
-    with open(road_map, "w") as f:
-        yaml.dump(data, f, explicit_start=True,
-                  default_flow_style=False)
+    road_map = Roadmap()
+    entry = road_map.remove(wp)
+    road_map.close()
+    if entry is not None:
+        _remove_cached_picture(entry)
 
 
 def blacklist_wallpaper():
-    try:
-        with open("{}/blacklist.yml"
-                  .format(BASE_CACHE_PATH), "r") as f:
-            blacklist = yaml.safe_load(f) or []
-    except FileNotFoundError:
-        blacklist = []
     with open("{}/current_wallpaper"
               .format(BASE_CACHE_PATH), "r") as f:
-        blacklisted_pix = f.readlines()[0].strip()
-    blacklist.append(blacklisted_pix)
-    with open("{}/blacklist.yml"
-              .format(BASE_CACHE_PATH), "w") as f:
-        yaml.dump(blacklist, f, explicit_start=True,
-                  default_flow_style=False)
+        lines = f.readlines()
+    blacklisted_pix = lines[0].strip()
+    pic_file = lines[4].strip()
+    blacklist = read_blacklist()
+    blacklist.add([blacklisted_pix])
+    if os.path.isfile(pic_file):
+        # Also remember its content, to recognize it under another url
+        blacklist.add_fingerprint(file_fingerprint(pic_file))
     remove_wallpaper_from_roadmap(blacklisted_pix)
 
 
@@ -452,28 +936,21 @@ def favorite_wallpaper(config):
     return False
 
 
-def clean_wallpaper_info(data):
+def clean_wallpaper_info(entry):
     """Return the information array for a wallpaper
 
     The returned array is ready to be saved in current_wallpaper file.
     """
-    if data["type"] == "local":
-        pic_file = data["image"]
-    else:
-        m = hashlib.md5()
-        m.update(data["image"].encode())
-        pic_file = "{}/pictures/{}-{}".format(
-            BASE_CACHE_PATH, data["type"], m.hexdigest())
-    rights = data.get("copyright")
+    rights = entry.copyright
     if rights is None or rights == "":
         rights = _("{title} by {author}").format(
-            title=data.get("description", _("Picture")),
-            author=data.get("author", "unknown"))
+            title=entry.description or _("Picture"),
+            author=entry.author or "unknown")
     description = _("{title} (on {source})").format(
         title=rights.replace("\n", " "),
-        source=data["type"])
-    return [data["image"], description, data["url"],
-            data["type"], pic_file]
+        source=entry.type)
+    return [entry.image, description, entry.url or "", entry.type,
+            entry.path]
 
 
 def current_wallpaper_info():
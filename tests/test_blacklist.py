@@ -0,0 +1,115 @@
+import io
+import os
+import yaml
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image, ImageDraw
+
+from chwall import blacklist
+from chwall.blacklist import Blacklist
+
+
+def picture(size, fmt="PNG"):
+    im = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(im)
+    draw.rectangle((50, 50, 200, 150), fill="red")
+    draw.ellipse((220, 100, 380, 280), fill="blue")
+    out = io.BytesIO()
+    im.resize(size).save(out, fmt)
+    return out.getvalue()
+
+
+class TestBlacklist(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.legacy_path = os.path.join(self.tmpdir.name, "blacklist.yml")
+        self.patches = [
+            patch.object(blacklist, "BLACKLIST_FILE",
+                         os.path.join(self.tmpdir.name, "blacklist.idx")),
+            patch.object(blacklist, "FINGERPRINTS_FILE",
+                         os.path.join(self.tmpdir.name, "fingerprints.idx")),
+            patch.object(blacklist, "LEGACY_BLACKLIST", self.legacy_path)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def test_01_add(self):
+        bl = Blacklist()
+        self.assertNotIn("a", bl)
+        bl.add(["a", "b", "a"])
+        self.assertIn("a", bl)
+        self.assertIn("b", bl)
+        self.assertEqual(len(bl), 2)
+        self.assertEqual(len(Blacklist()), 2)
+
+    def test_02_refresh(self):
+        first = Blacklist()
+        second = Blacklist()
+        second.add(["a"])
+        self.assertNotIn("a", first)
+        first.refresh()
+        self.assertIn("a", first)
+
+    def test_03_import_yaml_blacklist(self):
+        with open(self.legacy_path, "w") as f:
+            yaml.dump(["a", "b"], f)
+        bl = Blacklist()
+        self.assertIn("b", bl)
+        self.assertFalse(os.path.exists(self.legacy_path))
+        self.assertEqual(len(Blacklist()), 2)
+
+    def test_04_resized_variants(self):
+        bl = Blacklist()
+        bl.add(["https://images.unsplash.com/photo-1?ixid=a&w=1920",
+                "https://images.pexels.com/photos/2/a.jpg?cs=tinysrgb&h=650",
+                "https://example.com/image.php?h=3&q=80"])
+        self.assertIn("https://images.unsplash.com/photo-1?ixid=a&w=800", bl)
+        self.assertIn("https://images.unsplash.com/photo-1?ixid=a", bl)
+        self.assertNotIn("https://images.unsplash.com/photo-1?ixid=b", bl)
+        self.assertIn("https://images.pexels.com/photos/2/a.jpg?w=940", bl)
+        # Elsewhere, those parameters may identify the picture
+        self.assertIn("https://example.com/image.php?h=3&q=80", bl)
+        self.assertNotIn("https://example.com/image.php?h=4&q=80", bl)
+
+    def picture_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_05_fingerprint(self):
+        bl = Blacklist()
+        original = self.picture_file("original", picture((400, 300)))
+        sha, dhash = blacklist.file_fingerprint(original)
+        self.assertFalse(bl.matches_checksum(sha))
+        bl.add_fingerprint((sha, dhash))
+        self.assertTrue(bl.matches_checksum(sha))
+        resized = self.picture_file(
+            "resized", picture((200, 150), "JPEG"))
+        sha, dhash = blacklist.file_fingerprint(resized)
+        self.assertFalse(Blacklist().matches_checksum(sha))
+        self.assertTrue(Blacklist().resembles(dhash))
+        other = Image.new("RGB", (400, 300), "white")
+        ImageDraw.Draw(other).ellipse((10, 10, 150, 290), fill="green")
+        out = io.BytesIO()
+        other.save(out, "PNG")
+        other = self.picture_file("other", out.getvalue())
+        self.assertFalse(bl.resembles(blacklist.file_fingerprint(other)[1]))
+        broken = self.picture_file("broken", b"not a picture")
+        self.assertIsNone(blacklist.picture_dhash(broken))
+        self.assertFalse(bl.resembles(None))
+
+    def test_06_low_contrast(self):
+        bl = Blacklist()
+        # Hashes of dark pictures with a few faint stars
+        bl.add_fingerprint((b"a" * 32, 0x100808100000))
+        self.assertFalse(bl.resembles(0))
+        self.assertFalse(bl.resembles(0x100808100001))
+        bl.add_fingerprint((b"b" * 32, 0x0f0f0f0f0f0f0f0f))
+        self.assertTrue(bl.resembles(0x0f0f0f0f0f0f0f0e))
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+from chwall import cache
+from chwall.cache import PictureCache
+from chwall.utils import file_checksum
+
+
+class TestPictureCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pictures = os.path.join(self.tmpdir.name, "pictures")
+        os.makedirs(self.pictures)
+        self.patches = [
+            patch.object(cache, "CACHE_DB",
+                         os.path.join(self.tmpdir.name, "cache.db")),
+            patch.object(cache, "PICTURES_PATH", self.pictures)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def picture(self, name, size, mtime=None):
+        path = os.path.join(self.pictures, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_01_import_pictures_folder(self):
+        self.picture("a", 10)
+        self.picture("b.part", 5)
+        pic_cache = PictureCache()
+        self.assertEqual(pic_cache.total_size(), 10)
+        pic_cache.add(self.picture("c", 20))
+        self.assertEqual(pic_cache.total_size(), 30)
+        pic_cache.forget(os.path.join(self.pictures, "a"))
+        self.assertEqual(pic_cache.total_size(), 20)
+        pic_cache.close()
+
+    def test_02_evict(self):
+        old = self.picture("old", 10, 1000)
+        older = self.picture("older", 10, 500)
+        current = self.picture("current", 10, 100)
+        pic_cache = PictureCache()
+        new = self.picture("new", 10)
+        pic_cache.add(new)
+        pic_cache.touch(older)
+        self.assertEqual(pic_cache.evict(40), 0)
+        self.assertEqual(pic_cache.evict(20, protected={current}), 2)
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(new))
+        self.assertTrue(os.path.exists(older))
+        self.assertTrue(os.path.exists(current))
+        self.assertEqual(pic_cache.total_size(), 20)
+        pic_cache.close()
+
+    def test_03_picture_info(self):
+        im = Image.new("RGB", (40, 30), "white")
+        path = os.path.join(self.pictures, "a")
+        im.save(path, "PNG")
+        empty = self.picture("empty", 0)
+        pic_cache = PictureCache()
+        pic_cache.add(path)
+        pic_cache.touch(path)
+        info = pic_cache.get(path)
+        self.assertEqual((info["width"], info["height"]), (40, 30))
+        self.assertEqual(info["checksum"], file_checksum(path))
+        self.assertIsNotNone(info["last_shown"])
+        self.assertTrue(info["valid"])
+        self.assertFalse(pic_cache.get(empty)["valid"])
+        self.assertIsNone(pic_cache.get("missing"))
+        pic_cache.close()
+
+    def test_04_cleanup(self):
+        broken = self.picture("broken", 0)
+        gone = self.picture("gone", 10)
+        changed = self.picture("changed", 10)
+        kept = self.picture("kept", 10)
+        PictureCache().close()
+        os.unlink(gone)
+        with open(changed, "wb") as f:
+            f.truncate(0)
+        self.assertEqual(cache.count_broken_pictures_in_cache(), 1)
+        self.assertEqual(cache.cleanup_cache(), 2)
+        self.assertFalse(os.path.exists(broken))
+        self.assertFalse(os.path.exists(changed))
+        self.assertTrue(os.path.exists(kept))
+        self.assertEqual(cache.count_broken_pictures_in_cache(), 0)
+        self.assertEqual(cache.compute_cache_size(), "0.01 ko")
+        self.assertEqual(cache.cleanup_cache(clear_all=True), 1)
+        self.assertEqual(os.listdir(self.pictures), [])
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from chwall import fetcher
+
+
+class TestFetcherDependencies(unittest.TestCase):
+    def dependencies(self):
+        return {entry.name: fetcher._fetcher_dependencies(entry.path)
+                for entry in fetcher._fetcher_files()}
+
+    def test_01_dependencies(self):
+        deps = self.dependencies()
+        self.assertEqual(deps["flickr.py"], ["lxml"])
+        self.assertEqual(deps["local.py"], [])
+
+    def test_02_without_stdlib_module_names(self):
+        # Python older than 3.10
+        expected = self.dependencies()
+        with patch.object(sys, "stdlib_module_names", create=True):
+            del sys.stdlib_module_names
+            self.assertEqual(self.dependencies(), expected)
+            for name in ["os", "sys", "json", "xml", "sqlite3"]:
+                self.assertTrue(fetcher._is_stdlib_module(name), name)
+            for name in ["yaml", "lxml", "PIL"]:
+                self.assertFalse(fetcher._is_stdlib_module(name), name)
+
+
+class TestFetchersManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.patches = [
+            patch.object(fetcher, "MANIFEST_FILE",
+                         os.path.join(self.tmpdir.name, "fetchers.yml"))
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def test_01_names(self):
+        names = fetcher.fetcher_names()
+        self.assertIn("local", names)
+        self.assertNotIn("__init__", names)
+
+    def test_02_broken_fetcher(self):
+        load_fetcher = fetcher.load_fetcher
+
+        def _load_fetcher(name):
+            if name == "flickr":
+                raise ImportError("No module named 'lxml'")
+            return load_fetcher(name)
+
+        with patch.object(fetcher, "load_fetcher", _load_fetcher):
+            manifest = fetcher.fetchers_manifest()
+        self.assertNotIn("flickr", manifest)
+        self.assertIn("local", manifest)
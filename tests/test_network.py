@@ -0,0 +1,236 @@
+import os
+import hashlib
+import tempfile
+import threading
+import unittest
+import requests
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chwall import network
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve the content of the server, with support of Range requests.
+
+    When the server cut attribute is set to (index, size), the connection
+    of the request of this index is closed after size bytes. Requests
+    with a matching If-None-Match header are answered with a 304.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        index = len(server.requests)
+        server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.end_headers()
+            return
+        content = server.content
+        start, end = 0, len(content) - 1
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if byte_range is not None and if_range in (None, server.etag):
+            first, _sep, last = byte_range[len("bytes="):].partition("-")
+            start = int(first)
+            if last != "":
+                end = min(int(last), end)
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(
+                start, end, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if server.send_length:
+            self.send_header("Content-Length", str(end + 1 - start))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        body = content[start:end + 1]
+        if server.cut is not None and server.cut[0] == index:
+            body = body[:server.cut[1]]
+        self.close_connection = True
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client stopped reading
+            pass
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.content = os.urandom(3000)
+        self.server.etag = '"v1"'
+        self.server.send_length = True
+        self.server.cut = None
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = "http://127.0.0.1:{}/picture.jpg".format(
+            self.server.server_address[1])
+        self.patches = [
+            patch.object(network, "BACKOFF_BASE", 0.01),
+            # Bytes of an incomplete chunk are lost when the connection is
+            # cut.
+            patch.object(network, "DOWNLOAD_CHUNK_SIZE", 100),
+            patch.object(network, "HTTP_CACHE_PATH",
+                         os.path.join(self.tmpdir.name, "http"))
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+
+class TestDownload(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmpdir.name, "picture.jpg.part")
+        self.checksum = hashlib.sha256(self.server.content).hexdigest()
+
+    def test_01_download(self):
+        self.assertEqual(network.download(self.url, self.path),
+                         (self.checksum, 3000))
+        self.assertNotIn("Range", self.server.requests[0])
+        self.assertFalse(os.path.exists(self.path + network.STATE_SUFFIX))
+
+    def test_02_resume_after_cut(self):
+        self.server.cut = (0, 1000)
+        with self.assertRaises(network.RETRY_ERRORS):
+            network.download(self.url, self.path)
+        # Received bytes are kept for the next attempt
+        self.assertEqual(os.path.getsize(self.path), 1000)
+        self.assertEqual(network.download(self.url, self.path),
+                         (self.checksum, 3000))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]["Range"], "bytes=1000-")
+        self.assertEqual(self.server.requests[1]["If-Range"], '"v1"')
+
+    def test_03_resume_changed_file(self):
+        self.server.cut = (0, 1000)
+        with self.assertRaises(network.RETRY_ERRORS):
+            network.download(self.url, self.path)
+        self.server.content = os.urandom(2000)
+        self.server.etag = '"v2"'
+        checksum = hashlib.sha256(self.server.content).hexdigest()
+        # Whole new file is sent back instead of the asked range
+        self.assertEqual(network.download(self.url, self.path),
+                         (checksum, 2000))
+
+    def test_04_segments(self):
+        with patch.object(network, "MIN_SEGMENT_SIZE", 1000):
+            self.assertEqual(network.download(self.url, self.path,
+                                              segments=3),
+                             (self.checksum, 3000))
+        ranges = sorted(r["Range"] for r in self.server.requests[1:])
+        self.assertEqual(ranges, ["bytes=0-999", "bytes=1000-1999",
+                                  "bytes=2000-2999"])
+        self.assertFalse(os.path.exists(self.path + network.STATE_SUFFIX))
+
+    def test_05_resume_segments(self):
+        self.server.cut = (1, 500)
+        with patch.object(network, "MIN_SEGMENT_SIZE", 1000):
+            with self.assertRaises(network.RETRY_ERRORS):
+                network.download(self.url, self.path, segments=3)
+            self.assertTrue(os.path.exists(
+                self.path + network.STATE_SUFFIX))
+            self.assertEqual(network.download(self.url, self.path,
+                                              segments=3),
+                             (self.checksum, 3000))
+        # Only the missing part of the cut segment is asked again
+        resumed = [r["Range"] for r in self.server.requests[4:]]
+        self.assertEqual(len(resumed), 1)
+        self.assertIn(resumed[0], ["bytes=500-999", "bytes=1500-1999",
+                                   "bytes=2500-2999"])
+
+    def test_06_size_cap(self):
+        with self.assertRaises(network.DownloadTooLarge):
+            network.download(self.url, self.path, max_size=2000)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + network.STATE_SUFFIX))
+
+    def test_07_size_cap_without_length(self):
+        self.server.send_length = False
+        with self.assertRaises(network.DownloadTooLarge):
+            network.download(self.url, self.path, max_size=2000)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + network.STATE_SUFFIX))
+
+    def test_08_missing_picture(self):
+        with patch.object(RangeHandler, "do_GET",
+                          lambda handler: handler.send_error(404)):
+            with self.assertRaises(network.DownloadFailed):
+                network.download(self.url, self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestCachedGet(ServerTestCase):
+    def test_01_fresh_hit(self):
+        resp = network.cached_get(self.url)
+        self.assertFalse(resp.from_cache)
+        self.assertEqual(resp.content, self.server.content)
+        resp = network.cached_get(self.url)
+        self.assertTrue(resp.from_cache)
+        self.assertEqual(resp.content, self.server.content)
+        # Second response comes from the cache only
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_02_revalidate(self):
+        network.cached_get(self.url)
+        content = self.server.content
+        # Server would send this new content to an unconditional request
+        self.server.content = os.urandom(10)
+        resp = network.cached_get(self.url, ttl=0)
+        self.assertTrue(resp.from_cache)
+        self.assertEqual(resp.content, content)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]["If-None-Match"], '"v1"')
+        # Revalidation makes the cached response fresh again
+        network.cached_get(self.url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_03_changed(self):
+        network.cached_get(self.url)
+        self.server.content = os.urandom(10)
+        self.server.etag = '"v2"'
+        resp = network.cached_get(self.url, ttl=0)
+        self.assertFalse(resp.from_cache)
+        self.assertEqual(resp.content, self.server.content)
+        self.assertEqual(network.cached_get(self.url).content,
+                         self.server.content)
+
+    def test_04_stale_on_server_error(self):
+        network.cached_get(self.url)
+        content = self.server.content
+        with patch.object(RangeHandler, "do_GET",
+                          lambda handler: handler.send_error(503)):
+            resp = network.cached_get(self.url, ttl=0)
+        self.assertTrue(resp.from_cache)
+        self.assertEqual(resp.content, content)
+
+    def test_05_stale_on_connection_error(self):
+        network.cached_get(self.url)
+        content = self.server.content
+        self.server.shutdown()
+        self.server.server_close()
+        resp = network.cached_get(self.url, ttl=0)
+        self.assertTrue(resp.from_cache)
+        self.assertEqual(resp.content, content)
+
+    def test_06_error_without_cache(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            network.cached_get(self.url)
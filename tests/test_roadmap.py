@@ -0,0 +1,191 @@
+import os
+import yaml
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from chwall import roadmap
+from chwall.roadmap import Roadmap, RoadmapEntry
+
+
+def picture(url):
+    return {"image": url, "type": "test", "url": url}
+
+
+def head_data(road_map):
+    url, entry = road_map.head()
+    return url, entry.to_data()
+
+
+class TestRoadmap(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmpdir.name, "roadmap.db")
+        self.legacy_path = os.path.join(self.tmpdir.name, "roadmap")
+        self.patches = [
+            patch.object(roadmap, "ROADMAP_DB", db_path),
+            patch.object(roadmap, "LEGACY_ROADMAP", self.legacy_path)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def fill(self, road_map, urls, shuffle=False):
+        with road_map:
+            road_map.store_pictures({u: picture(u) for u in urls})
+            road_map.append_pending(urls, shuffle=shuffle)
+
+    def test_01_pending_order(self):
+        road_map = Roadmap()
+        self.fill(road_map, ["a", "b", "c"])
+        road_map.store_pictures({"z": picture("z")})
+        road_map.push_front("z")
+        self.assertEqual(list(road_map.iter_pending()), ["z", "a", "b", "c"])
+        self.assertEqual(head_data(road_map), ("z", picture("z")))
+        road_map.close()
+
+    def test_02_history_navigation(self):
+        road_map = Roadmap()
+        self.fill(road_map, ["a", "b", "c"])
+        for url in ["a", "b", "c"]:
+            self.assertEqual(head_data(road_map), (url, picture(url)))
+            road_map.mark_shown(url)
+        self.assertEqual(list(road_map.iter_history()), ["a", "b", "c"])
+        self.assertEqual(road_map.history_neighbour(False),
+                         (None, None, None))
+        position, url, entry = road_map.history_neighbour()
+        self.assertEqual((url, entry.to_data()), ("b", picture("b")))
+        road_map.set_history_cursor(position)
+        position, url, _data = road_map.history_neighbour()
+        self.assertEqual(url, "a")
+        road_map.set_history_cursor(position)
+        self.assertEqual(road_map.history_neighbour()[1], None)
+        self.assertEqual(road_map.history_neighbour(False)[1], "b")
+        # History itself is left untouched
+        self.assertEqual(list(road_map.iter_history()), ["a", "b", "c"])
+        road_map.close()
+
+    def test_03_capped_history(self):
+        road_map = Roadmap()
+        urls = [str(i) for i in range(10)]
+        self.fill(road_map, urls)
+        for url in urls:
+            road_map.mark_shown(url, history_size=4)
+        self.assertEqual(list(road_map.iter_history()), urls[-4:])
+        self.assertEqual(list(road_map.iter_history(1, 2)), ["7", "8"])
+        self.assertEqual(road_map.history_count(), 4)
+        road_map.prune()
+        self.assertFalse(road_map.contains("0"))
+        road_map.close()
+
+    def test_04_remove_and_reset(self):
+        road_map = Roadmap()
+        self.fill(road_map, ["a", "b", "c"])
+        road_map.mark_shown("a")
+        self.assertEqual(road_map.remove("b").to_data(), picture("b"))
+        self.assertIsNone(road_map.get("b"))
+        self.assertEqual(road_map.pending_count(), 1)
+        road_map.reset()
+        self.assertEqual(road_map.pending_count(), 0)
+        # History is kept
+        self.assertEqual(list(road_map.iter_history()), ["a"])
+        self.assertTrue(road_map.contains("a"))
+        self.assertFalse(road_map.contains("c"))
+        road_map.close()
+
+    def test_05_import_yaml_roadmap(self):
+        legacy = {
+            "data": {u: picture(u) for u in ["a", "b", "c"]},
+            "pictures": ["b", "c"],
+            "history": ["a"]
+        }
+        with open(self.legacy_path, "w") as f:
+            yaml.dump(legacy, f)
+        road_map = Roadmap()
+        self.assertEqual(list(road_map.iter_pending()), ["b", "c"])
+        self.assertEqual(list(road_map.iter_history()), ["a"])
+        self.assertEqual(road_map.get("c").to_data(), picture("c"))
+        self.assertFalse(os.path.exists(self.legacy_path))
+        road_map.close()
+
+    def test_06_shuffled_pending(self):
+        road_map = Roadmap()
+        urls = [str(i) for i in range(100)]
+        self.fill(road_map, urls, shuffle=True)
+        pending = list(road_map.iter_pending())
+        self.assertEqual(sorted(pending), sorted(urls))
+        self.assertNotEqual(pending, urls)
+        self.assertEqual(road_map.head()[0], pending[0])
+        road_map.mark_shown(pending[0])
+        road_map.remove(pending[1])
+        self.assertEqual(road_map.head()[0], pending[2])
+        self.assertEqual(road_map.pending_count(), 98)
+        road_map.close()
+
+    def test_07_entry(self):
+        road_map = Roadmap()
+        data = {"image": "https://example.com/a.jpg", "type": "Example",
+                "url": "https://example.com/a", "copyright": "Someone"}
+        road_map.store_pictures({data["image"]: data})
+        entry = road_map.get(data["image"])
+        self.assertEqual(entry.to_data(), data)
+        self.assertEqual(
+            entry.path, roadmap.picture_cache_path(data["image"], "Example"))
+        local = RoadmapEntry("/tmp/a.jpg", "local")
+        self.assertEqual(local.path, "/tmp/a.jpg")
+        road_map.close()
+
+    def test_08_skip(self):
+        road_map = Roadmap()
+        self.fill(road_map, ["a", "b", "c"])
+        self.assertEqual(road_map.head({"a", "b"})[0], "c")
+        # Skipped pictures are still pending
+        self.assertEqual(road_map.head()[0], "a")
+        for url in ["a", "b", "c"]:
+            road_map.mark_shown(url)
+        self.assertEqual(road_map.history_neighbour(skip={"b"})[1], "a")
+        road_map.close()
+
+    def test_09_weighted_pools(self):
+        road_map = Roadmap({"big": 1, "small": 3})
+        pictures = {}
+        for pool, count in [("big", 200), ("small", 10)]:
+            for i in range(count):
+                url = "{}-{}".format(pool, i)
+                pictures[url] = RoadmapEntry(url, "test", pool=pool)
+        with road_map:
+            road_map.store_pictures(pictures)
+            road_map.append_pending(list(pictures))
+        self.assertEqual(road_map.pending_count_by_pool(),
+                         {"big": 200, "small": 10})
+        expected = list(road_map.iter_pending())
+        shown = []
+        url, _entry = road_map.head()
+        while url is not None:
+            shown.append(url)
+            road_map.mark_shown(url)
+            url, _entry = road_map.head()
+        self.assertEqual(shown, expected)
+        # Small pool pictures come way before the end of the big one
+        small = [i for i, u in enumerate(shown) if u.startswith("small")]
+        self.assertLess(small[-1], 40)
+        road_map.close()
+
+
+class TestPermute(unittest.TestCase):
+    def test_01_bijection(self):
+        for size in [1, 2, 3, 10, 257, 1000]:
+            positions = [roadmap.permute(i, size, 42) for i in range(size)]
+            self.assertEqual(sorted(positions), list(range(size)))
+
+    def test_02_seed(self):
+        first = [roadmap.permute(i, 100, 1) for i in range(100)]
+        second = [roadmap.permute(i, 100, 2) for i in range(100)]
+        self.assertNotEqual(first, second)
+        self.assertEqual(
+            [roadmap.permute(i, 100, None) for i in range(100)],
+            list(range(100)))
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from PIL import Image
+
+from chwall import blacklist, cache, fetcher, health, roadmap, utils, \
+                   wallpaper
+
+
+class TestPickWallpaper(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        base = self.tmpdir.name
+        self.local = os.path.join(base, "local")
+        os.makedirs(self.local)
+        self.patches = [
+            patch.object(utils, "BASE_CACHE_PATH", base),
+            patch.object(wallpaper, "BASE_CACHE_PATH", base),
+            patch.object(roadmap, "ROADMAP_DB",
+                         os.path.join(base, "roadmap.db")),
+            patch.object(roadmap, "LEGACY_ROADMAP",
+                         os.path.join(base, "roadmap")),
+            patch.object(cache, "CACHE_DB", os.path.join(base, "cache.db")),
+            patch.object(cache, "PICTURES_PATH",
+                         os.path.join(base, "pictures")),
+            patch.object(blacklist, "BLACKLIST_FILE",
+                         os.path.join(base, "blacklist.idx")),
+            patch.object(blacklist, "FINGERPRINTS_FILE",
+                         os.path.join(base, "fingerprints.idx")),
+            patch.object(blacklist, "LEGACY_BLACKLIST",
+                         os.path.join(base, "blacklist.yml")),
+            patch.object(health, "HEALTH_FILE",
+                         os.path.join(base, "health.yml")),
+            patch.object(fetcher, "MANIFEST_FILE",
+                         os.path.join(base, "fetchers.yml")),
+            patch.object(wallpaper, "set_wallpaper",
+                         lambda path, config: path),
+            patch.object(wallpaper, "_filler", None),
+            patch.object(wallpaper, "_exhausted_sources", set())
+        ]
+        for p in self.patches:
+            p.start()
+        self.config = {
+            "general": {
+                "sources": ["local"], "favorites_path":
+                os.path.join(base, "favorites"), "source_weights": {},
+                "history_size": 500, "pool_size": 200,
+                "max_download_size": 100, "download_segments": 1,
+                "prefetch_count": 3, "cache_size": 0, "refill_threshold": 5
+            },
+            "local": {"paths": [self.local], "favorites": False}
+        }
+
+    def tearDown(self):
+        if wallpaper._filler is not None:
+            wallpaper._filler.join(30)
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def pick_in_thread(self):
+        result = []
+        picker = threading.Thread(
+            target=lambda: result.append(
+                wallpaper.pick_wallpaper(self.config)),
+            daemon=True)
+        picker.start()
+        picker.join(30)
+        self.assertFalse(picker.is_alive(), "pick_wallpaper is stuck")
+        return result[0]
+
+    def test_01_cycle_small_library(self):
+        pictures = []
+        for i in range(3):
+            path = os.path.join(self.local, "{}.png".format(i))
+            Image.new("RGB", (20, 10), (80 * i, 0, 0)).save(path)
+            pictures.append(path)
+        added = []
+        refill_roadmap = wallpaper.refill_roadmap
+
+        def _refill_roadmap(*args):
+            added.append(refill_roadmap(*args))
+            return added[-1]
+
+        with patch.object(wallpaper, "refill_roadmap", _refill_roadmap):
+            shown = [self.pick_in_thread() for _i in range(10)]
+        self.assertEqual(sorted(set(shown[:3])), pictures)
+        # Current wallpaper is never shown twice in a row
+        for previous, current in zip(shown, shown[1:]):
+            self.assertNotEqual(previous, current)
+        # No pointless refill while the previous one was still running
+        self.assertNotIn(0, added)
+
+    def test_02_no_picture(self):
+        self.assertIsNone(self.pick_in_thread())
+
+    def test_03_refill_samples_pool(self):
+        for i in range(30):
+            path = os.path.join(self.local, "{}.png".format(i))
+            Image.new("RGB", (20, 10), (i, 0, 0)).save(path)
+        self.config["general"]["pool_size"] = 12
+        self.assertEqual(wallpaper.refill_roadmap(self.config), 12)
+        self.assertEqual(wallpaper.refill_roadmap(self.config), 12)
+        # Only 6 pictures have never been added yet
+        self.assertEqual(wallpaper.refill_roadmap(self.config), 6)
+        road_map = roadmap.Roadmap()
+        try:
+            self.assertEqual(road_map.pending_count(), 30)
+        finally:
+            road_map.close()
+        # Everything is pending, nothing left to add
+        self.assertEqual(wallpaper.refill_roadmap(self.config), 0)
+
+    def test_04_sample_is_uniform(self):
+        counts = [0] * 10
+        for _i in range(2000):
+            sample = wallpaper.PictureSample(3)
+            for url in range(10):
+                sample.add(url, None)
+            for url in sample.pictures():
+                counts[url] += 1
+        # Each picture is kept 600 times on average
+        for count in counts:
+            self.assertGreater(count, 480)
+            self.assertLess(count, 720)
+
+    def test_05_single_filler(self):
+        pictures = []
+        for i in range(3):
+            path = os.path.join(self.local, "{}.png".format(i))
+            Image.new("RGB", (20, 10), (80 * i, 0, 0)).save(path)
+            pictures.append(path)
+        release = threading.Event()
+        iter_source_pictures = wallpaper.iter_source_pictures
+
+        def _iter_source_pictures(fetcher, config):
+            yield from iter_source_pictures(fetcher, config)
+            # The source is slow to end its list
+            release.wait(30)
+
+        refills = []
+        refill_roadmap = wallpaper.refill_roadmap
+
+        def _refill_roadmap(*args):
+            refills.append(args)
+            return refill_roadmap(*args)
+
+        with patch.object(wallpaper, "iter_source_pictures",
+                          _iter_source_pictures), \
+                patch.object(wallpaper, "refill_roadmap", _refill_roadmap):
+            first = self.pick_in_thread()
+            # The first picture is served before the source ends its list
+            self.assertFalse(release.is_set())
+            threading.Timer(0.5, release.set).start()
+            second = self.pick_in_thread()
+        self.assertEqual(len(refills), 1)
+        self.assertIn(second, pictures)
+        self.assertNotEqual(first, second)
+
+    def test_06_exhausted_source(self):
+        self.config["general"]["refill_threshold"] = 0
+        self.assertEqual(wallpaper.sources_to_refill(self.config),
+                         ["local"])
+        self.assertEqual(wallpaper.refill_roadmap(self.config, None,
+                                                  ["local"]), 0)
+        # Nothing to expect from it until next complete refill
+        self.assertEqual(wallpaper.sources_to_refill(self.config), [])
+        self.config["general"]["refill_threshold"] = 5
+        self.assertEqual(wallpaper.sources_to_refill(self.config),
+                         ["local"])
+        Image.new("RGB", (20, 10)).save(os.path.join(self.local, "0.png"))
+        self.assertEqual(wallpaper.refill_roadmap(self.config), 1)
+        self.assertNotIn("local", wallpaper._exhausted_sources)